@@ -1,3 +1,3 @@
 import logging
 
-__version__ = "0.3.1"
+__version__ = "0.3.2"
@@ -0,0 +1,81 @@
+import base64
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from datetime import datetime, timezone
+from io import BytesIO
+
+# saml2_assertion_namespace: XML namespace of SAML 2.0 assertion elements
+saml2_assertion_namespace = "{urn:oasis:names:tc:SAML:2.0:assertion}"
+
+# role_attribute_name: Name of the attribute listing the AWS roles the user can assume
+role_attribute_name = "https://aws.amazon.com/SAML/Attributes/Role"
+
+attribute_tag = saml2_assertion_namespace + "Attribute"
+attribute_value_tag = saml2_assertion_namespace + "AttributeValue"
+validity_tags = (saml2_assertion_namespace + "Conditions", saml2_assertion_namespace + "SubjectConfirmationData")
+
+AwsRole = namedtuple("AwsRole", ["role_arn", "principal_arn", "account_id"])
+
+ParsedAssertion = namedtuple("ParsedAssertion", ["roles", "not_before", "not_on_or_after"])
+
+
+def parse_saml_datetime(value: str):
+    # SAML timestamps are xs:dateTime in UTC such as 2020-12-06T10:43:56.880Z,
+    # fractional seconds are dropped which can only shorten the validity window
+    value = value.strip().rstrip("Z").split(".")[0]
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+
+
+def parse_role(value: str):
+    # Note the format of the attribute value should be role_arn,principal_arn
+    # but lots of blogs list it as principal_arn,role_arn so let's reverse
+    # them if needed
+    chunks = [chunk.strip() for chunk in value.split(",")]
+    if len(chunks) != 2:
+        return None
+    if "saml-provider" in chunks[0]:
+        chunks.reverse()
+    role_arn, principal_arn = chunks
+    return AwsRole(role_arn, principal_arn, role_arn.split(":")[4] if role_arn.count(":") >= 5 else None)
+
+
+def parse_assertion(assertion: str):
+    # single pass over the decoded assertion with iterparse, attribute elements are cleared once read
+    # so that assertions listing thousands of roles are never held as a whole tree.
+    # Roles keep the assertion order, duplicated values are listed once.
+    roles, seen = [], set()
+    not_before, not_on_or_after = None, None
+    values = []
+    for _, element in ET.iterparse(BytesIO(base64.b64decode(assertion))):
+        tag = element.tag
+        if tag == attribute_value_tag:
+            values.append(element.text)
+        elif tag == attribute_tag:
+            # values of an attribute end before it, its name is only checked once they are all read
+            if element.get("Name") == role_attribute_name:
+                for value in values:
+                    role = parse_role(value) if value is not None else None
+                    if role is not None and role not in seen:
+                        seen.add(role)
+                        roles.append(role)
+            values = []
+            element.clear()
+        elif tag in validity_tags:
+            # the (not_before, not_on_or_after) window during which the assertion can be exchanged
+            # combines Conditions and SubjectConfirmationData bounds
+            if element.get("NotBefore") is not None:
+                value = parse_saml_datetime(element.get("NotBefore"))
+                not_before = value if not_before is None else max(not_before, value)
+            if element.get("NotOnOrAfter") is not None:
+                value = parse_saml_datetime(element.get("NotOnOrAfter"))
+                not_on_or_after = value if not_on_or_after is None else min(not_on_or_after, value)
+    return ParsedAssertion(roles, not_before, not_on_or_after)
+
+
+def get_aws_roles(assertion: str):
+    return parse_assertion(assertion).roles
+
+
+def get_assertion_validity(assertion: str):
+    parsed_assertion = parse_assertion(assertion)
+    return parsed_assertion.not_before, parsed_assertion.not_on_or_after
@@ -0,0 +1,176 @@
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+AWS_CREDENTIALS_FILE = Path.home() / ".aws" / "credentials"
+
+# section_header: [profile] line of an ini file, as recognized by configparser
+section_header = re.compile(r"^\s*\[(?P<name>[^\]]+)\]")
+
+# key_line: key = value or key: value line of an ini file
+key_line = re.compile(r"^\s*(?P<key>[^=:\s\[#;][^=:]*?)\s*[=:]")
+
+
+def profile_name(role_arn: str):
+    # arn:aws:iam::000000000000:role/path/Role.Admin gives 000000000000-Role.Admin
+    account_id = role_arn.split(":")[4]
+    role_name = role_arn.split("/")[-1]
+    return f"{account_id}-{role_name}"
+
+
+def profile_values(credentials: dict):
+    return {
+        "aws_access_key_id": credentials["AccessKeyId"],
+        "aws_secret_access_key": credentials["SecretAccessKey"],
+        "aws_session_token": credentials["SessionToken"],
+        "aws_security_token": credentials["SessionToken"],
+    }
+
+
+def update_sections(lines: list, sections: dict):
+    # sections maps a section name to the keys to set in it. Only these keys are rewritten,
+    # other sections, keys and comments are kept as they are
+    # key_indent is the indentation of the last key line, lines indented deeper continue its value
+    # (as configparser reads them), replaced tells whether that value is rewritten. blank lines are held
+    # until it is known whether the value goes on after them
+    updated, section, pending = [], None, {}
+    key_indent, replaced, blanks = None, False, []
+
+    def flush_pending():
+        # keys not found in the section are added after its last line
+        while len(updated) > 0 and updated[-1].strip() == "":
+            updated.pop()
+        updated.extend(f"{key} = {value}\n" for key, value in pending.items())
+        updated.append("\n")
+
+    for line in lines:
+        if key_indent is not None and line.strip() == "":
+            blanks.append(line if line.endswith("\n") else line + "\n")
+            continue
+        if key_indent is not None and len(line) - len(line.lstrip()) > key_indent:
+            if not replaced:
+                updated.extend(blanks)
+                updated.append(line if line.endswith("\n") else line + "\n")
+            blanks = []
+            continue
+        if key_indent is not None and line.lstrip().startswith(("#", ";")):
+            # configparser skips comments within a value
+            updated.extend(blanks)
+            updated.append(line if line.endswith("\n") else line + "\n")
+            blanks = []
+            continue
+        updated.extend(blanks)
+        key_indent, replaced, blanks = None, False, []
+        header = section_header.match(line)
+        if header is not None:
+            if section in sections:
+                flush_pending()
+            section = header.group("name").strip()
+            pending = dict(sections.get(section, {}))
+            updated.append(line if line.endswith("\n") else line + "\n")
+            continue
+        key = key_line.match(line)
+        if key is not None:
+            key_indent = len(line) - len(line.lstrip())
+        if section in sections and key is not None and key.group("key").strip().lower() in sections[section]:
+            key_name = key.group("key").strip().lower()
+            if key_name in pending:
+                updated.append(f"{key_name} = {pending.pop(key_name)}\n")
+            # a key listed twice is only written once, the continuation lines of its value are dropped
+            replaced = True
+            continue
+        updated.append(line if line.endswith("\n") else line + "\n")
+    updated.extend(blanks)
+    if section in sections:
+        flush_pending()
+
+    present = set(section_header.match(line).group("name").strip() for line in lines if section_header.match(line))
+    for section, values in sections.items():
+        if section not in present:
+            if len(updated) > 0 and updated[-1].strip() != "":
+                updated.append("\n")
+            updated.append(f"[{section}]\n")
+            updated.extend(f"{key} = {value}\n" for key, value in values.items())
+            updated.append("\n")
+    return updated
+
+
+def lock_file_descriptor(fd: int):
+    if os.name == "nt":
+        import msvcrt
+        while True:
+            try:
+                # first byte of the lock file, LK_LOCK itself gives up after 10 seconds
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    import fcntl
+    fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def unlock_file_descriptor(fd: int):
+    if os.name == "nt":
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        return
+    import fcntl
+    fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def locked(path: Path):
+    # advisory lock on a sibling file: the credentials file itself is replaced on every write,
+    # so a lock held on it would not be seen by the next writer
+    lock_file = path.with_name(f".{path.name}.lock")
+    fd = os.open(lock_file.as_posix(), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        lock_file_descriptor(fd)
+        try:
+            yield
+        finally:
+            unlock_file_descriptor(fd)
+    finally:
+        os.close(fd)
+
+
+def write_profiles(profiles: dict, aws_credentials_path: Path = AWS_CREDENTIALS_FILE):
+    # profiles maps a profile name to STS credentials, all of them are written in a single pass.
+    # Concurrent runs (parallel CI jobs) are serialized by a lock, and the file is replaced atomically
+    # so that the AWS CLI never reads a truncated file
+    aws_credentials_path.parent.mkdir(exist_ok=True)
+    # a symlinked credentials file is updated where it points to
+    target = aws_credentials_path.resolve()
+    with locked(target):
+        try:
+            with open(target.as_posix(), "r") as configfile:
+                lines = configfile.readlines()
+            mode = os.stat(target.as_posix()).st_mode & 0o777
+        except FileNotFoundError:
+            lines, mode = [], 0o600
+
+        # Put the credentials into a dedicated section instead of clobbering
+        # the default credentials
+        updated = update_sections(lines, {profile: profile_values(credentials)
+                                          for profile, credentials in profiles.items()})
+
+        temporary = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        fd = os.open(temporary.as_posix(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        try:
+            with os.fdopen(fd, "w") as configfile:
+                configfile.writelines(updated)
+                configfile.flush()
+                os.fsync(configfile.fileno())
+            os.replace(temporary.as_posix(), target.as_posix())
+        except BaseException:
+            if temporary.exists():
+                temporary.unlink()
+            raise
+        # make the rename itself durable
+        directory_fd = os.open(target.parent.as_posix(), os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
@@ -1,38 +1,90 @@
+import json
+import re
 import urllib.parse
+from fnmatch import translate
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException, ElementNotInteractableException, ElementClickInterceptedException, NoSuchWindowException
-from selenium.webdriver.remote.webelement import WebElement
-import tempfile
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException, ElementClickInterceptedException, ElementNotInteractableException, NoSuchWindowException
+from concurrent.futures import ThreadPoolExecutor
+from awscli_saml_sso import browser_profile
 from awscli_saml_sso.config_parser import CustomConfigParser
+from awscli_saml_sso.console import ask, bind
+from awscli_saml_sso.cache import get_cached_assertion, store_assertion
+from awscli_saml_sso.driver_store import install_driver
+from awscli_saml_sso.flight_recorder import FlightRecorder
+from awscli_saml_sso.page_states import load_learned_flow, microsoft_flow, store_learned_flow, wait_for_next_state, wait_for_state
+from awscli_saml_sso.timings import timer
 from urllib.parse import urlparse
 from enum import Enum
 import importlib
-from time import sleep
+from time import monotonic, sleep
 from awscli_saml_sso import __path__ as module_path
 from pathlib import Path
+from os import environ
 
-# awssamlhomepage: The AWS SAML start page that end the authentication process
-awssamlhomepage = "https://signin.aws.amazon.com/saml"
+# awssamlhomepage: The AWS SAML start page that end the authentication process,
+# ASS_AWS_SAML_HOMEPAGE can point it to a local stand-in (see benchmarks/login.py)
+awssamlhomepage = environ.get("ASS_AWS_SAML_HOMEPAGE", "https://signin.aws.amazon.com/saml")
+
+# awsdomain: Reaching any page of this domain means the identity provider flow is over
+awsdomain = "aws.amazon.com" if "ASS_AWS_SAML_HOMEPAGE" not in environ else urlparse(awssamlhomepage).netloc
+
+# browser_arguments: Additional browser command line switches, space separated
+browser_arguments = environ.get("ASS_BROWSER_ARGUMENTS", "").split()
+
+# launch_profile: "full" starts browsers as installed. "lean" starts them without what a scripted login never
+# uses and that slows start up down: background networking, component updates, extensions, sync and GPU,
+# which breaks identity providers relying on a browser extension (see benchmarks/browser.py)
+launch_profile = environ.get("ASS_BROWSER_LAUNCH", "full")
+
+lean_arguments = [
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-extensions",
+    "--disable-sync",
+    "--disable-gpu",
+    "--disable-default-apps",
+    "--disable-domain-reliability",
+    "--disable-client-side-phishing-detection",
+    "--disable-features=Translate,OptimizationHints,MediaRouter",
+]
+
+# saml_capture: How the SAMLResponse posted to awssamlhomepage is read. "devtools" reads network events
+# of Chromium based browsers from their performance log, "seleniumwire" routes all traffic through
+# its man in the middle proxy, which is the only way for browsers without DevTools (Firefox)
+saml_capture = environ.get("ASS_SAML_CAPTURE", "devtools")
+
+# blocked_urls: Resources a headless login does not need, never downloaded (images, fonts, analytics beacons).
+# Wildcards as in DevTools Network.setBlockedURLs, ASS_BLOCKED_URLS="" disables blocking
+blocked_urls = environ.get("ASS_BLOCKED_URLS",
+                           "*.png* *.jpg* *.jpeg* *.gif* *.ico* *.webp* *.woff* *.woff2* *.ttf* *.otf* "
+                           "*google-analytics.com/* *googletagmanager.com/* *.clarity.ms/* "
+                           "*browser.events.data.microsoft.com/* *dc.services.visualstudio.com/*").split()
 
 # supported_browsers: Browsers kind supported by selenium webdriver
 class SupportedBrowsers(Enum):
     EDGE = {"name": "Edge",
-            "browser_class": "seleniumwire.webdriver.Edge",
+            "browser_class": "selenium.webdriver.Edge",
+            "wire_browser_class": "seleniumwire.webdriver.Edge",
+            "logging_prefs": "ms:loggingPrefs",
             "driver_class": "webdriver_manager.microsoft.EdgeChromiumDriverManager",
             "options_class": "selenium.webdriver.edge.options.Options",
             "service_class": "selenium.webdriver.edge.service.Service",
             "enabled": True}
     CHROME = {"name": "Chrome",
-              "browser_class": "seleniumwire.webdriver.Chrome",
+              "browser_class": "selenium.webdriver.Chrome",
+              "wire_browser_class": "seleniumwire.webdriver.Chrome",
+              "logging_prefs": "goog:loggingPrefs",
               "driver_class": "webdriver_manager.chrome.ChromeDriverManager",
               "options_class": "selenium.webdriver.chrome.options.Options",
               "service_class": "selenium.webdriver.chrome.service.Service",
               "enabled": False}
     FIREFOX = {"name": "Firefox",
               "browser_class": "seleniumwire.webdriver.Firefox",
+              "wire_browser_class": "seleniumwire.webdriver.Firefox",
+              "logging_prefs": None,
               "driver_class": "webdriver_manager.firefox.GeckoDriverManager",
               "options_class": "selenium.webdriver.FirefoxOptions",
               "service_class": "selenium.webdriver.FirefoxService",
@@ -44,18 +96,33 @@ def import_class(class_path):
     return _class
 
 
-def mysleep():
-    sleep(0.2)
+def uses_devtools(browser_kind: SupportedBrowsers):
+    return saml_capture == "devtools" and browser_kind.value["logging_prefs"] is not None
+
 
 # navigation_timeout: The delay in seconds we wait page changes
 # must be high enough for awssamlhomepage
 navigation_timeout = 90
 
-ignored_exceptions = (NoSuchElementException,StaleElementReferenceException,ElementNotInteractableException,)
+# action_retry_delay: Seconds before detecting a page again when acting on it failed, while it slides in for instance
+action_retry_delay = 0.2
 
 failure_message = 'please try it all again...\nYou can check browser rendering by appending --show-browser'
 
-def start_browser(show_browser: bool, browser_kind: SupportedBrowsers, user_data_dir: str):
+def merge_disabled_features(arguments: list):
+    # Chromium only keeps the last --disable-features switch, features of all of them are given in one
+    prefix = "--disable-features="
+    features = [feature for argument in arguments if argument.startswith(prefix)
+                for feature in argument[len(prefix):].split(",") if feature != ""]
+    merged = [argument for argument in arguments if not argument.startswith(prefix)]
+    if len(features) > 0:
+        merged.append(prefix + ",".join(dict.fromkeys(features)))
+    return merged
+
+
+def start_browser(show_browser: bool, browser_kind: SupportedBrowsers, user_data_dir: str, offline: bool=False,
+                  quiet: bool=False, profile_mode: str=None):
+    # profile_mode overrides browser_profile.profile_mode for this browser
     browser = None
     _options_class = import_class(browser_kind.value["options_class"])
     options = _options_class()
@@ -66,7 +133,8 @@ def start_browser(show_browser: bool, browser_kind: SupportedBrowsers, user_data
     # https://peter.sh/experiments/chromium-command-line-switches/
     if not show_browser:
         options.add_argument("--headless=new")
-    options.add_argument(f"--user-data-dir={user_data_dir}")
+    launched_dir = browser_profile.acquire(user_data_dir, profile_mode)
+    options.add_argument(f"--user-data-dir={launched_dir}")
     options.add_argument(f"--password-store=basic")
     options.add_argument("--window-position=0,0")
     options.add_argument("--window-size=768,768")
@@ -74,220 +142,395 @@ def start_browser(show_browser: bool, browser_kind: SupportedBrowsers, user_data
     options.add_argument("--no-first-run")
     options.add_argument("--no-default-browser-check")
     options.add_argument("--remote-debugging-pipe")
-    print(f"⚙️ Starting{'' if show_browser else ' headless'} {browser_kind.value['name']} browser")
+    for argument in merge_disabled_features((lean_arguments if launch_profile == "lean" else []) + browser_arguments):
+        options.add_argument(argument)
+    devtools = uses_devtools(browser_kind)
+    if devtools:
+        # network events only, see wait_for_saml_response
+        options.set_capability(browser_kind.value["logging_prefs"], {"performance": "ALL"})
+        options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+    if not quiet:
+        print(f"⚙️ Starting{'' if show_browser else ' headless'} {browser_kind.value['name']} browser")
     _service_class = import_class(browser_kind.value["service_class"])
     _driver_class = import_class(browser_kind.value["driver_class"])
-    _browser_class = import_class(browser_kind.value["browser_class"])
+    _browser_class = import_class(browser_kind.value["browser_class" if devtools else "wire_browser_class"])
 
     if browser_kind == SupportedBrowsers.EDGE:
-        browser = _browser_class(
-            service=_service_class(
-                executable_path=_driver_class(
-                    url="https://msedgedriver.microsoft.com/",
-                    latest_release_url="https://msedgedriver.microsoft.com/LATEST_RELEASE"
-                ).install()),
-            options=options
-            )
+        driver_manager = _driver_class(
+            url="https://msedgedriver.microsoft.com/",
+            latest_release_url="https://msedgedriver.microsoft.com/LATEST_RELEASE"
+        )
     else:
-        browser = _browser_class(service=_service_class(_driver_class().install()), options=options)
+        driver_manager = _driver_class()
+    # driver binary comes from the local driver store instead of driver_manager.install()
+    with timer("driver resolution"):
+        executable_path = install_driver(driver_manager, offline)
+    try:
+        with timer("browser launch"):
+            if devtools:
+                browser = _browser_class(service=_service_class(executable_path=executable_path), options=options)
+            else:
+                # captured requests are kept in memory, and only a few of them
+                browser = _browser_class(service=_service_class(executable_path=executable_path), options=options,
+                                         seleniumwire_options={"request_storage": "memory",
+                                                               "request_storage_max_size": 10})
+                # only the POST to awssamlhomepage is captured
+                browser.scopes = [re.escape(awssamlhomepage)]
+            if not show_browser:
+                block_resources(browser)
+    except BaseException:
+        browser_profile.release(user_data_dir, launched_dir, keep=False)
+        raise
+    # see quit_browser
+    browser.profile_dirs = (user_data_dir, launched_dir)
 
     if not browser:
         raise SystemExit(f"🛑 Unable to find browser {browser.value}, please install it first")
     else:
         return browser
 
-    
-def loop_input_password(browser, idp_password: str, password_elem):
-    mysleep()
-    try:
-        if password_elem is None:
-            # wait till page changes and displays the password element
-            password_elem = WebDriverWait(browser, navigation_timeout).until(
-                EC.presence_of_element_located((By.XPATH, "//input[@type='password']")))
-        password_elem.clear()
-        password_elem.click()
-        # get the password and enter it
-        password_elem.send_keys(idp_password)
-        password_button = WebDriverWait(browser, navigation_timeout).until(
-            EC.any_of(EC.presence_of_element_located((By.XPATH, "//input[@value='Sign in']")),
-                      EC.presence_of_element_located((By.XPATH, "//input[@value='Se connecter']"))))
-        password_button.click()
-    except StaleElementReferenceException as e:
-        print("🔄 Trying again")
-        loop_input_password(browser, idp_password, None)
-
-
-def handle_code(browser, element):
-    mysleep()
-    element.click()
-    # prompt for the MFA code and enter it
-    mfa_code = input("⌨️ Please enter MFA code: ")
-    element.send_keys(mfa_code + Keys.ENTER)
+
+def start_browser_in_background(show_browser: bool, browser_kind: SupportedBrowsers, user_data_dir: str,
+                                offline: bool=False):
+    # driver resolution and browser launch run while the user answers prompts, the returned future
+    # gives the browser, or raises what start_browser raised
+    print(f"⚙️ Starting{'' if show_browser else ' headless'} {browser_kind.value['name']} browser")
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(bind(start_browser), show_browser=show_browser, browser_kind=browser_kind,
+                             user_data_dir=user_data_dir, offline=offline, quiet=True)
+    executor.shutdown(wait=False)
+    return future
+
+
+def discard_browser(browser_future):
+    # login ended before the browser started in background was used
     try:
-        # wait 1 second at most and fail if MFA code is rejected
-        WebDriverWait(browser, 1).until(EC.presence_of_element_located((By.ID, "idSpan_SAOTCC_Error_OTC")))
-        save_page(browser.page_source, "error_wrong_code")
-        raise SystemExit("❌ Your MFA code is wrong, " + failure_message)
-    except TimeoutException:
-        # after 1 second with no rejection, it should mean MFA code is accepted
-        pass
-    print("✅ MFA code is correct, waiting for AWS SAML homepage...")
-
-
-def handle_password_and_or_mfa(browser,
-                               config_parser: CustomConfigParser,
-                               idp_nickname: str,
-                               idp_password: str):
-    mysleep()
-    # wait till page changes and shows passowrd invite or displays the MFA code element
-    next_elem = WebDriverWait(browser, navigation_timeout, ignored_exceptions=ignored_exceptions).until(
-        EC.any_of(EC.presence_of_element_located((By.NAME, "otc")),
-                    EC.presence_of_element_located((By.ID, "idRichContext_DisplaySign")),
-                    EC.presence_of_element_located((By.ID, "idRemoteNGC_DisplaySign")),
-                    EC.presence_of_element_located((By.ID, "passwordError")),
-                    EC.presence_of_element_located((By.ID, "usernameError")),
-                    EC.presence_of_element_located((By.XPATH, "//input[@type='password' and @tabindex='0']")),
-                    ))
-    
-    if next_elem.get_attribute('name') == "otc":
-        handle_code(browser, next_elem)
+        browser = browser_future.result()
+    except BaseException:
+        return
+    quit_browser(browser)
 
-    elif next_elem.get_attribute('id') in ["idRichContext_DisplaySign", "idRemoteNGC_DisplaySign"]:
-        print(f'⌨️ Enter this on you authentication app, then wait : {next_elem.text}')
 
-    elif next_elem.get_attribute('type') == "password":
-        # enter the password
-        loop_input_password(browser, idp_password, next_elem)
-        handle_password_and_or_mfa(browser, config_parser, idp_nickname, idp_password)
+def quit_browser(browser):
+    with timer("browser quit"):
+        browser.quit()
+    user_data_dir, launched_dir = browser.profile_dirs
+    with timer("browser profile release"):
+        browser_profile.release(user_data_dir, launched_dir)
 
-    elif next_elem.get_attribute('id') == "passwordError":
-        save_page(browser.page_source, "error_incorrect_passwd")
-        raise SystemExit("❌ Your password is incorrect, " + failure_message)
 
-    elif next_elem.get_attribute('id') == "usernameError":
-        save_page(browser.page_source, "error_unknown_email")
-        raise SystemExit("❌ Your email is not known for the identity provider, " + failure_message)
+def block_resources(browser):
+    if len(blocked_urls) == 0:
+        return
+    if hasattr(browser, "execute_cdp_cmd"):
+        # Chromium based browsers drop these requests themselves
+        browser.execute_cdp_cmd("Network.enable", {})
+        browser.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_urls})
+    else:
+        # seleniumwire only intercepts requests in scope, blocked ones are brought in scope to be aborted
+        blocked_patterns = [translate(url) for url in blocked_urls]
+        browser.scopes = browser.scopes + blocked_patterns
+
+        def interceptor(request):
+            if any(re.match(pattern, request.url) for pattern in blocked_patterns):
+                request.abort()
+
+        browser.request_interceptor = interceptor
+
     
+def enter_login(browser, element, idp_login: str, idp_password: str):
     try:
-        # in case any AWS page shows up, no need to perform after mfa handling
-        WebDriverWait(browser, navigation_timeout/15, ignored_exceptions=ignored_exceptions).until(
-            EC.url_contains("aws.amazon.com"))
-    except TimeoutException:
-        handle_after_mfa(browser)
+        element.click()
+    except (ElementClickInterceptedException, ElementNotInteractableException):
+        # this happens when login screen is skipped and password or mfa screen is shown
+        return
+    element.send_keys(idp_login + Keys.ENTER)
 
 
-def handle_after_mfa(browser):
-    mysleep()
+def select_known_account(browser, element, idp_login: str, idp_password: str):
     try:
-        # in case improve connection shows up
-        next_elem = WebDriverWait(browser, navigation_timeout/15, ignored_exceptions=ignored_exceptions).until(
-            EC.any_of(EC.presence_of_element_located((By.LINK_TEXT, "Not now")),
-                    EC.presence_of_element_located((By.LINK_TEXT, "Plus tard")),
-                    EC.presence_of_element_located((By.XPATH, "//input[@value='Non']")),
-                    EC.presence_of_element_located((By.XPATH, "//input[@value='No']")),
-                    EC.presence_of_element_located((By.ID, "idDiv_SAASDS_Title")),
-                    ))
-
-        if next_elem.get_attribute('id') == "idDiv_SAASDS_Title":
-            save_page(browser.page_source, "error_request_denied")
-            raise SystemExit("❌ Request was denied, could be unsuccessfull MFA, " + failure_message)
-        else:
-            next_elem.click()
-    except TimeoutException: 
+        element.click()
+    except ElementClickInterceptedException:
+        # this happens when login screen is skipped and password or mfa screen is shown
         pass
 
 
-def save_page(page_source: str, prefix: str):
-    # usage example : save_page(browser.page_source, "password")
-    _, temp_file_name = tempfile.mkstemp(prefix=prefix + '_', suffix='.html', text=True)
-    with open(temp_file_name, "w", encoding='utf-8') as f:
-        f.write(page_source)
-        print(f'💾 Saved page {prefix} to {temp_file_name}, you can send it to support')
+@timer("password entry")
+def enter_password(browser, element, idp_login: str, idp_password: str):
+    element.clear()
+    element.click()
+    # get the password and enter it
+    element.send_keys(idp_password)
+    _, password_button = wait_for_state(browser, microsoft_flow, ["sign_in"], navigation_timeout, {})
+    password_button.click()
 
 
-def login_and_get_assertion(show_browser: bool=False,
-                            use_browser: bool=False,
-                            idp_nickname: str=None,
-                            use_stored: bool=False):
-    config_parser = CustomConfigParser()
-    idp_nickname, idpentryurl = config_parser.get_idp_url(idp_nickname)
-    mysleep()
-    enabled_supported_browsers = [sb for sb in SupportedBrowsers if sb.value["enabled"]]
-    browser_name, user_data_dir, first_time = config_parser.get_browser_details(
-        idp_nickname=idp_nickname,
-        supported_browsers=enabled_supported_browsers)
-    browser_kind = [bk for bk in SupportedBrowsers if bk.value["name"] == browser_name][0]
-    mysleep()
-    if not use_browser:
-        idp_login = config_parser.get_login(idp_nickname, use_stored)
-        mysleep()
-        idp_password = config_parser.get_password(idp_nickname, use_stored)
-        mysleep()
-    browser = start_browser(show_browser=True if first_time or use_browser else show_browser,
-                            browser_kind=browser_kind,
-                            user_data_dir=user_data_dir)
-    
-    idp_is_microsoft = True if urlparse(idpentryurl).netloc.endswith("microsoft.com") else False
-    
+@timer("mfa code entry")
+def enter_code(browser, element, idp_login: str, idp_password: str):
+    element.click()
+    # prompt for the MFA code and enter it
+    mfa_code = ask("⌨️ Please enter MFA code: ")
+    element.send_keys(mfa_code + Keys.ENTER)
+
+
+def show_number(browser, element, idp_login: str, idp_password: str):
+    print(f'⌨️ Enter this on you authentication app, then wait : {element.text}')
+
+
+def click(browser, element, idp_login: str, idp_password: str):
+    element.click()
+
+
+# microsoft_handlers: Action taken on each state of microsoft_flow
+microsoft_handlers = {
+    "login": enter_login,
+    "known_account": select_known_account,
+    "password": enter_password,
+    "otc": enter_code,
+    "number_matching": show_number,
+    "stay_signed_in": click,
+    "not_now": click,
+}
+
+
+def run_flow(browser, flow: dict, handlers: dict, idp_nickname: str, idpentryurl: str, idp_login: str, idp_password: str,
+             recorder: FlightRecorder):
+    # each page is handled as soon as it shows up until any AWS page is reached,
+    # pages are expected in the order seen during the last login
+    context = {"login": idp_login, "awsdomain": awsdomain}
+    learned = load_learned_flow(idp_nickname)
+    observed = []
+    state = "start"
+    retrying_since = None
+    while state != "aws":
+        expected, phase = flow["transitions"][state]
+        try:
+            with timer(phase):
+                next_state, element = wait_for_next_state(browser, flow, expected, navigation_timeout, context,
+                                                          learned[len(observed)] if len(observed) < len(learned) else None,
+                                                          recorder)
+        except TimeoutException:
+            if state == "start":
+                recorder.dump(browser, "error_login_elem")
+                raise SystemExit(f"❌ Could not get login element from {idpentryurl}, check the URL and " + failure_message)
+            recorder.dump(browser, "error_timeout")
+            raise SystemExit(f"❌ Could not complete authentication within {navigation_timeout} seconds, " + failure_message)
+        if next_state in flow["errors"]:
+            prefix, message = flow["errors"][next_state]
+            recorder.dump(browser, prefix)
+            raise SystemExit(message + failure_message)
+        if state == "otc":
+            print("✅ MFA code is correct, waiting for AWS SAML homepage...")
+        if next_state != "aws":
+            try:
+                handlers[next_state](browser, element, idp_login, idp_password)
+            except (StaleElementReferenceException, ElementClickInterceptedException, ElementNotInteractableException):
+                # page changed meanwhile or is not ready for input yet, detect it again
+                if retrying_since is None:
+                    print("🔄 Trying again")
+                    retrying_since = monotonic()
+                elif monotonic() - retrying_since > navigation_timeout:
+                    recorder.dump(browser, "error_timeout")
+                    raise SystemExit(f"❌ Could not complete authentication within {navigation_timeout} seconds, "
+                                     + failure_message)
+                sleep(action_retry_delay)
+                continue
+        retrying_since = None
+        observed.append(next_state)
+        state = next_state
+    if observed != learned:
+        store_learned_flow(idp_nickname, observed)
+
+
+def clear_captured_requests(browser):
+    # requests captured during a previous login of a warm browser must not be mistaken for this one
+    if hasattr(browser, "wait_for_request"):
+        del browser.requests
+    else:
+        browser.get_log("performance")
+
+
+def wait_for_saml_response(browser, timeout: float):
+    if hasattr(browser, "wait_for_request"):
+        request = browser.wait_for_request(awssamlhomepage, timeout=timeout)
+        body = request.body.decode("utf8")
+    else:
+        # Network.requestWillBeSent of the POST to awssamlhomepage carries the form body, every log read
+        # empties the performance log so only new events are looked at
+        body = None
+        deadline = monotonic() + timeout
+        while body is None:
+            for entry in browser.get_log("performance"):
+                if "Network.requestWillBeSent" not in entry["message"]:
+                    continue
+                params = json.loads(entry["message"])["message"]["params"]
+                if params["request"]["method"] == "POST" and params["request"]["url"].startswith(awssamlhomepage):
+                    body = params["request"].get("postData")
+                    if body is None:
+                        # large bodies are not inlined in the event
+                        body = browser.execute_cdp_cmd("Network.getRequestPostData",
+                                                       {"requestId": params["requestId"]})["postData"]
+                    break
+            if body is None:
+                if monotonic() > deadline:
+                    raise TimeoutException(f"No request to {awssamlhomepage} within {timeout} seconds")
+                sleep(0.1)
+    return urllib.parse.parse_qs(body)["SAMLResponse"][0]
+
+
+# microsoft_domains: Identity provider hosts of Microsoft Entra, whose JavaScript login can't be replayed over HTTP
+microsoft_domains = ["microsoft.com", "microsoftonline.com", "live.com"]
+
+
+def is_microsoft_idp(idpentryurl: str):
+    netloc = urlparse(idpentryurl).netloc.split(":")[0]
+    return any(netloc == domain or netloc.endswith("." + domain) for domain in microsoft_domains)
+
+
+def run_login_flow(browser,
+                   config_parser: CustomConfigParser,
+                   idp_nickname: str,
+                   idpentryurl: str,
+                   first_time: bool,
+                   use_browser: bool,
+                   idp_login: str,
+                   idp_password: str):
+    # drive an already started browser through the identity provider flow and return the SAML assertion,
+    # the browser may be reused afterwards (see daemon.py)
+    idp_is_microsoft = is_microsoft_idp(idpentryurl)
+
+    clear_captured_requests(browser)
+    # what the login went through, written only if it fails
+    recorder = FlightRecorder(idp_nickname)
+
     try:
         if first_time and idp_is_microsoft:
             browser.get(f"file://{Path(module_path[0]) / 'first_time.html'}")
             radio_button = browser.find_element(By.ID, "radio")
             WebDriverWait(browser, navigation_timeout).until(EC.element_to_be_selected(radio_button))
-            mysleep()
         
-        browser.get(idpentryurl)
-        mysleep()
+        with timer("idp page load"):
+            browser.get(idpentryurl)
+        recorder.record("start", idpentryurl)
 
-        try:
-            if not use_browser:
-                # wait until
-                # screen shows already known logins OR
-                # screen shows the input box with the login element OR
-                # screen goes directly to AWS page because every thing is already setup
-                next_elem = WebDriverWait(browser, navigation_timeout, ignored_exceptions=ignored_exceptions).until(
-                    EC.any_of(EC.presence_of_element_located((By.NAME, "loginfmt")),
-                            EC.presence_of_element_located((By.XPATH, f"//div[@data-test-id='{idp_login}']")),
-                            EC.url_contains("aws.amazon.com")
-                            ))
-                if isinstance(next_elem, WebElement):
-                    # in case screen does not go directlty to AWS page
-                    mysleep()
-                    try:
-                        # in case of login screen
-                        next_elem.click()
-                        # in case of input box, enter the login
-                        if next_elem.get_attribute('name') == 'loginfmt':
-                            next_elem.send_keys(idp_login + Keys.ENTER)
-                    except ElementClickInterceptedException:
-                        # this happens when login screen is skipped and password or mfa screen is shown
-                        pass
-                    # handle pasword and/or MFA directly in case of passwordless
-                    handle_password_and_or_mfa(browser, config_parser, idp_nickname, idp_password)
+        if not use_browser:
+            run_flow(browser, microsoft_flow, microsoft_handlers, idp_nickname, idpentryurl, idp_login, idp_password,
+                     recorder)
 
-            try:
-                WebDriverWait(browser, navigation_timeout, ignored_exceptions=ignored_exceptions).until(
-                    EC.url_contains("aws.amazon.com"))
+        try:
+            with timer("saml response wait"):
+                if use_browser:
+                    # user fills in everything in the browser
+                    wait_for_state(browser, microsoft_flow, ["aws"], navigation_timeout, {"awsdomain": awsdomain},
+                                   recorder)
                 # last step: wait until AWS SAML homepage displays and return assertion
-                request = browser.wait_for_request(awssamlhomepage, timeout=navigation_timeout)
-                assertion = urllib.parse.unquote(str(request.body).split("=")[1])
-                return assertion, idp_nickname
-            except TimeoutException:
-                save_page(browser.page_source, "error_timeout")
-                raise SystemExit(f"❌ Could not complete authentication within {navigation_timeout} seconds, " + failure_message)
-        
+                return wait_for_saml_response(browser, navigation_timeout)
         except TimeoutException:
-            save_page(browser.page_source, "error_login_elem")
-            raise SystemExit(f"❌ Could not get login element from {idpentryurl}, check the URL and " + failure_message)
+            recorder.dump(browser, "error_timeout")
+            raise SystemExit(f"❌ Could not complete authentication within {navigation_timeout} seconds, " + failure_message)
 
     except NoSuchWindowException:
         raise SystemExit(f"🤷 Seems somebody closed the browser")
 
     except Exception as e:
-        save_page(browser.page_source, "error_unknown")
+        recorder.dump(browser, "error_unknown")
         raise e
-    
-    finally:
-        # close the headless browser in all circumstances
-        print("🗑️ Closing browser")
-        browser.quit()
+
+
+def login_and_get_assertion(show_browser: bool=False,
+                            use_browser: bool=False,
+                            idp_nickname: str=None,
+                            use_stored: bool=False,
+                            use_cache: bool=True,
+                            offline: bool=False,
+                            use_daemon: bool=False,
+                            login_engine: str="auto"):
+    config_parser = CustomConfigParser()
+    # stored settings typed in or learned during the login are written to the config file once, at the end
+    with config_parser.transaction():
+        idp_nickname, idpentryurl = config_parser.get_idp_url(idp_nickname)
+        if use_cache:
+            assertion = get_cached_assertion(idp_nickname)
+            if assertion is not None:
+                print(f"✅ Reusing still valid SAML assertion for {idp_nickname}, no need to open browser")
+                return assertion, idp_nickname
+
+        # plain HTML login forms (Keycloak, ADFS) are filled in over HTTP, the browser is only started
+        # for identity providers that need it, which is remembered for next logins
+        stored_login_engine = config_parser.get_login_engine(idp_nickname)
+        use_http = login_engine == "http" or (login_engine == "auto" and stored_login_engine != "browser"
+                                              and not (use_browser or show_browser)
+                                              and not is_microsoft_idp(idpentryurl))
+        if not use_browser:
+            config_parser.prefetch_password(idp_nickname)
+
+        # a browser sure to be used is started while the user types login and password, unless this is a first
+        # login which asks for the browser to use, or the daemon keeps one
+        enabled_supported_browsers = [sb for sb in SupportedBrowsers if sb.value["enabled"]]
+        browser, browser_future = None, None
+        if not use_http and config_parser.has_browser_details(idp_nickname):
+            browser_name, user_data_dir, first_time = config_parser.get_browser_details(
+                idp_nickname=idp_nickname,
+                supported_browsers=enabled_supported_browsers)
+            if not first_time and not (use_daemon and not (use_browser or show_browser)):
+                browser_kind = [bk for bk in SupportedBrowsers if bk.value["name"] == browser_name][0]
+                browser_future = start_browser_in_background(show_browser=use_browser or show_browser,
+                                                             browser_kind=browser_kind,
+                                                             user_data_dir=user_data_dir,
+                                                             offline=offline)
+
+        try:
+            idp_login, idp_password = None, None
+            if not use_browser:
+                with timer("credential prompts"):
+                    idp_login = config_parser.get_login(idp_nickname, use_stored)
+                    idp_password = config_parser.get_password(idp_nickname, use_stored)
+
+            if use_http:
+                from awscli_saml_sso.http_login import HttpLoginUnsupported, login_with_http
+                try:
+                    with timer("http login"):
+                        assertion = login_with_http(idp_nickname, idpentryurl, idp_login, idp_password)
+                    if stored_login_engine != "http":
+                        config_parser.store_login_engine(idp_nickname, "http")
+                    store_assertion(idp_nickname, assertion)
+                    return assertion, idp_nickname
+                except HttpLoginUnsupported as e:
+                    if login_engine == "http":
+                        raise SystemExit(f"❌ {idp_nickname} can't be logged in without browser: {e}")
+                    print(f"⚙️ {idp_nickname} needs a browser to log in ({e}), it will be used from now on")
+                    config_parser.store_login_engine(idp_nickname, "browser")
+
+            browser_name, user_data_dir, first_time = config_parser.get_browser_details(
+                idp_nickname=idp_nickname,
+                supported_browsers=enabled_supported_browsers)
+            browser_kind = [bk for bk in SupportedBrowsers if bk.value["name"] == browser_name][0]
+
+            if use_daemon and not (first_time or use_browser or show_browser):
+                # warm headless browser kept by a background daemon, only usable without visible browser
+                from awscli_saml_sso.daemon import login_with_daemon
+                with timer("daemon login"):
+                    assertion = login_with_daemon(idp_nickname, idp_login, idp_password, offline)
+                store_assertion(idp_nickname, assertion)
+                return assertion, idp_nickname
+
+            if browser_future is not None:
+                with timer("browser startup wait"):
+                    browser = browser_future.result()
+            else:
+                browser = start_browser(show_browser=True if first_time or use_browser else show_browser,
+                                        browser_kind=browser_kind,
+                                        user_data_dir=user_data_dir,
+                                        offline=offline)
+            assertion = run_login_flow(browser, config_parser, idp_nickname, idpentryurl,
+                                       first_time, use_browser, idp_login, idp_password)
+            store_assertion(idp_nickname, assertion)
+            return assertion, idp_nickname
+
+        finally:
+            # close the headless browser in all circumstances
+            if browser is not None:
+                print("🗑️ Closing browser")
+                quit_browser(browser)
+            elif browser_future is not None:
+                discard_browser(browser_future)
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+from os import environ
+from pathlib import Path
+
+# profile_mode: How the browser profile of an identity provider (user_data_dir) is kept between logins.
+# "persistent" lets the browser use it as is, and it grows with caches, service workers and components.
+# "pruned" cuts it down to kept_entries each time the browser quits.
+# "snapshot" starts the browser on a copy of kept_entries in a memory backed folder (snapshot_folder),
+# copied back over user_data_dir when the browser quits
+profile_mode = environ.get("ASS_BROWSER_PROFILE", "persistent")
+
+# kept_entries: What a login needs from a browser profile, the identity provider session: cookies and
+# local storage, with the key cookies are encrypted with (Local State) and profile preferences
+kept_entries = [
+    "Local State",
+    "Default/Preferences",
+    "Default/Cookies",
+    "Default/Cookies-journal",
+    "Default/Network/Cookies",
+    "Default/Network/Cookies-journal",
+    "Default/Local Storage",
+]
+
+
+def snapshot_folder():
+    # tmpfs: per user runtime folder of systemd, or shared memory, or temporary folder as a last resort
+    for folder in (environ.get("XDG_RUNTIME_DIR"), "/dev/shm"):
+        if folder and os.path.isdir(folder) and os.access(folder, os.W_OK):
+            return folder
+    return tempfile.gettempdir()
+
+
+def copy_entries(source: Path, destination: Path):
+    for entry in kept_entries:
+        source_entry, destination_entry = source / entry, destination / entry
+        if source_entry.is_dir():
+            shutil.copytree(source_entry.as_posix(), destination_entry.as_posix(), dirs_exist_ok=True)
+        elif source_entry.exists():
+            destination_entry.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source_entry.as_posix(), destination_entry.as_posix())
+
+
+def replace_folder(folder: Path, entries_from: Path):
+    # kept entries are copied next to folder, which is then swapped with renames,
+    # so that an interrupted copy never leaves a profile without its cookies
+    staged = folder.with_name(f".{folder.name}.new")
+    previous = folder.with_name(f".{folder.name}.old")
+    for leftover in (staged, previous):
+        shutil.rmtree(leftover.as_posix(), ignore_errors=True)
+    staged.mkdir(mode=0o700, parents=True)
+    copy_entries(entries_from, staged)
+    if folder.exists():
+        os.rename(folder.as_posix(), previous.as_posix())
+    os.rename(staged.as_posix(), folder.as_posix())
+    shutil.rmtree(previous.as_posix(), ignore_errors=True)
+
+
+def prune(user_data_dir: str):
+    folder = Path(user_data_dir)
+    if folder.exists():
+        replace_folder(folder, folder)
+
+
+def in_use(folder: Path):
+    # a Chromium based browser holds SingletonLock (a link to hostname-pid) while running on folder
+    lock = folder / "SingletonLock"
+    if not os.path.lexists(lock.as_posix()):
+        return False
+    try:
+        pid = int(os.readlink(lock.as_posix()).rsplit("-", 1)[1])
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        # left behind by a browser that crashed
+        return False
+    except (OSError, IndexError, ValueError):
+        # alive but owned by someone else, or not a link (Windows lock file)
+        return True
+    return True
+
+
+def acquire(user_data_dir: str, mode: str = None):
+    # folder the browser is started with, mode overrides profile_mode
+    if (mode or profile_mode) != "snapshot":
+        return user_data_dir
+    snapshot = Path(tempfile.mkdtemp(prefix="awscli_saml_sso_profile_", dir=snapshot_folder()))
+    copy_entries(Path(user_data_dir), snapshot)
+    return snapshot.as_posix()
+
+
+def release(user_data_dir: str, launched_dir: str, keep: bool = True):
+    # once the browser quit, what the login left in its profile is kept in user_data_dir, unless keep is False
+    # (the browser did not start)
+    if launched_dir != user_data_dir:
+        try:
+            # a browser started meanwhile on user_data_dir keeps its own session
+            if keep and not in_use(Path(user_data_dir)):
+                replace_folder(Path(user_data_dir), Path(launched_dir))
+        finally:
+            shutil.rmtree(launched_dir, ignore_errors=True)
+    elif profile_mode == "pruned" and keep:
+        prune(user_data_dir)
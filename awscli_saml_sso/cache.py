@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone, timedelta
+from hashlib import md5
+from pathlib import Path
+
+from awscli_saml_sso.assertion import get_assertion_validity
+from awscli_saml_sso.config_parser import CONFIG_FOLDER
+
+logger = logging.getLogger(__name__)
+
+CACHE_FOLDER = CONFIG_FOLDER / "cache"
+
+# assertion_expiry_margin: Seconds before NotOnOrAfter from which a cached assertion is not reused anymore,
+# leaving enough time to call AWS STS with it
+assertion_expiry_margin = 30
+
+
+def cache_file(kind: str, key: str):
+    return CACHE_FOLDER / f"{kind}_{md5(key.encode('utf8')).hexdigest()}.json"
+
+
+def read_json_file(source: Path):
+    try:
+        with open(source.as_posix(), "r") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_file(target: Path, content: dict):
+    # content may hold bearer secrets: keep it readable by current user only
+    # and replace it atomically so that a concurrent reader never sees a partial file
+    target.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    temporary = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    fd = os.open(temporary.as_posix(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as fp:
+        json.dump(content, fp)
+    os.replace(temporary.as_posix(), target.as_posix())
+
+
+def read_cache(kind: str, key: str):
+    return read_json_file(cache_file(kind, key))
+
+
+def write_cache(kind: str, key: str, content: dict):
+    write_json_file(cache_file(kind, key), content)
+
+
+def get_cached_assertion(idp_nickname: str):
+    cached = read_cache("assertion", idp_nickname)
+    if cached is None:
+        logger.info(f"SAML assertion cache miss for {idp_nickname}")
+        return None
+    now = datetime.now(timezone.utc)
+    not_before = datetime.fromisoformat(cached["not_before"]) if cached["not_before"] else None
+    not_on_or_after = datetime.fromisoformat(cached["not_on_or_after"])
+    if not_before is not None and now < not_before:
+        logger.info(f"SAML assertion cache miss for {idp_nickname}: not valid before {not_before}")
+        return None
+    if now >= not_on_or_after - timedelta(seconds=assertion_expiry_margin):
+        logger.info(f"SAML assertion cache miss for {idp_nickname}: expired at {not_on_or_after}")
+        return None
+    logger.info(f"SAML assertion cache hit for {idp_nickname}: valid until {not_on_or_after}")
+    return cached["assertion"]
+
+
+def store_assertion(idp_nickname: str, assertion: str):
+    try:
+        not_before, not_on_or_after = get_assertion_validity(assertion)
+    except Exception as e:
+        logger.warning(f"Could not read SAML assertion validity, it will not be cached: {e}")
+        return
+    if not_on_or_after is None:
+        logger.info(f"SAML assertion for {idp_nickname} has no NotOnOrAfter, it will not be cached")
+        return
+    write_cache("assertion", idp_nickname, {
+        "assertion": assertion,
+        "not_before": not_before.isoformat() if not_before else None,
+        "not_on_or_after": not_on_or_after.isoformat(),
+    })
+    logger.info(f"SAML assertion for {idp_nickname} cached until {not_on_or_after}")
+
+
+def get_cached_credentials(idp_nickname: str, role_arn: str, expiry_margin: int):
+    cached = read_cache("credentials", f"{idp_nickname}/{role_arn}")
+    if cached is None:
+        logger.info(f"Credentials cache miss for {role_arn}")
+        return None
+    expiration = datetime.fromisoformat(cached["Expiration"])
+    if datetime.now(timezone.utc) >= expiration - timedelta(seconds=expiry_margin):
+        logger.info(f"Credentials cache miss for {role_arn}: expiring at {expiration}")
+        return None
+    logger.info(f"Credentials cache hit for {role_arn}: valid until {expiration}")
+    return cached
+
+
+def store_credentials(idp_nickname: str, role_arn: str, credentials: dict):
+    expiration = credentials["Expiration"]
+    write_cache("credentials", f"{idp_nickname}/{role_arn}", {
+        "AccessKeyId": credentials["AccessKeyId"],
+        "SecretAccessKey": credentials["SecretAccessKey"],
+        "SessionToken": credentials["SessionToken"],
+        "Expiration": expiration if isinstance(expiration, str) else expiration.isoformat(),
+    })
@@ -1,11 +1,13 @@
 from pathlib import Path
-import configparser
-import getpass
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from subprocess import Popen, PIPE, STDOUT
-import keyring
 from hashlib import md5
 from urllib.parse import urlparse
 
+from awscli_saml_sso.console import ask
+
 idp_url_prompt = "⌨️ Please enter your identity provider url of the form https://<fqdn>:<port>/adfs/ls/IdpInitiatedSignOn.aspx?loginToRp=urn:amazon:webservices"
 idp_nickname_prompt = "⌨️ Give a nickame for this new identity provider: "
 
@@ -20,43 +22,67 @@ def is_valid_url(url):
 CONFIG_FOLDER = Path(Path.home(), ".awscli_saml_sso")
 DEPRECATED_CREDENTIALS_FILE = Path(Path.home(), ".awscli_saml_sso_credentials")
 
+# stored_passwords: Keyring lookups already done by this process, by idp nickname
+stored_passwords = {}
+_stored_passwords_lock = threading.Lock()
+
 class CustomConfigParser():
 
     def __init__(self):
+        from awscli_saml_sso.storage import open_settings
         CONFIG_FOLDER.mkdir(exist_ok=True)
         self.credentials_file = CONFIG_FOLDER / "credentials"
         if DEPRECATED_CREDENTIALS_FILE.exists():
             DEPRECATED_CREDENTIALS_FILE.rename(self.credentials_file.as_posix())
-        self.credentials_file.touch(mode=0o600, exist_ok=True)
-        with open(self.credentials_file.as_posix(), "r") as fp:
-            self.credentials = configparser.ConfigParser()
-            self.credentials.read_file(fp)
+        # settings of each identity provider, by idp nickname, see storage.py for available backends
+        self.settings = open_settings()
+        # keyring lookups started ahead of the password prompt, by idp nickname
+        self.password_lookups = {}
+        self.transaction_depth = 0
 
     @classmethod
     def clean(self):
         if CONFIG_FOLDER.exists():
             CONFIG_FOLDER.rename(CONFIG_FOLDER.as_posix() + ".OLD")
 
+    @contextmanager
+    def transaction(self):
+        # changes stored inside are written once, when the outermost transaction ends, even on error
+        # so that what the user typed in is kept
+        self.transaction_depth += 1
+        try:
+            yield self
+        finally:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.commit()
+
     def store(self):
-        with open(self.credentials_file.as_posix(), "w") as fp:
-            self.credentials.write(fp)
+        if self.transaction_depth == 0:
+            self.commit()
+
+    def commit(self):
+        self.settings.commit()
 
     def store_browser_details(self, idp_nickname, browser_name, user_data_dir):
-        self.credentials[idp_nickname]["browser_name"] = browser_name
-        self.credentials[idp_nickname]["user_data_dir"] = user_data_dir
+        self.settings.set(idp_nickname, "browser_name", browser_name)
+        self.settings.set(idp_nickname, "user_data_dir", user_data_dir)
         self.store()
 
+    def has_browser_details(self, idp_nickname):
+        return self.settings.get(idp_nickname, "browser_name") is not None
+
     def get_browser_details(self, idp_nickname, supported_browsers):
-        if idp_nickname in self.credentials and "browser_name" in self.credentials[idp_nickname]:
-            browser_name = self.credentials[idp_nickname]["browser_name"]
-            user_data_dir = self.credentials[idp_nickname]["user_data_dir"]
+        if self.has_browser_details(idp_nickname):
+            browser_name = self.settings.get(idp_nickname, "browser_name")
+            user_data_dir = self.settings.get(idp_nickname, "user_data_dir")
             first_time = False if Path(user_data_dir).exists() else True
             return browser_name, user_data_dir, first_time
         
         selected_browser_kind = None
         for browser_kind in supported_browsers:
             print("⚠️ Please use a browser that is already installed on your system")
-            if input(f"Do you want to use {browser_kind.value['name']} browser ? (y/n) ") == "y":
+            if ask(f"Do you want to use {browser_kind.value['name']} browser ? (y/n) ") == "y":
                 selected_browser_kind = browser_kind.value
                 break
         if selected_browser_kind == None:
@@ -78,10 +104,9 @@ class CustomConfigParser():
         return new_idp_nickname, idp_url
     
     def get_idp_url_for_idp_nickname(self, idp_nickname):
-        sections = self.credentials.sections()
-        if len(sections) > 0 and idp_nickname in self.credentials:
+        if idp_nickname in self.settings:
             print(f'✅ {idp_nickname} is already known, cool')
-            return idp_nickname, self.credentials[idp_nickname]["idp_url"]
+            return idp_nickname, self.settings.get(idp_nickname, "idp_url")
         else:
             print(f'❌ No such IDP nickname as {idp_nickname}')
             return self.get_idp_url()
@@ -89,7 +114,7 @@ class CustomConfigParser():
     def get_idp_url(self, idp_nickname=None):
         if idp_nickname is not None:
             return self.get_idp_url_for_idp_nickname(idp_nickname)
-        sections = self.credentials.sections()
+        sections = self.settings.nicknames()
         if len(sections) == 0:
             print("❗You don't have any stored identity provider, configure one now")
             new_idp_nickname = input(idp_nickname_prompt)
@@ -98,7 +123,6 @@ class CustomConfigParser():
             print("⤵️ You have stored these identity providers")
             print()
             for i, idp in enumerate(sections):
-                section = self.credentials[idp]
                 print(f"[{i}] {idp}")
             print()
             choice_text = 'choose 0'
@@ -116,27 +140,27 @@ class CustomConfigParser():
             except:
                 return self.get_idp_url()
             idp_nickname = sections[int(idp_index)]
-            stored_idp_url = self.credentials[idp_nickname]["idp_url"]
+            stored_idp_url = self.settings.get(idp_nickname, "idp_url")
             input_idp_url = input(f"⌨{idp_url_prompt} [{stored_idp_url}]: ")
             if input_idp_url == "":
-                return idp_nickname, self.credentials[idp_nickname]["idp_url"]
+                return idp_nickname, stored_idp_url
             else:
                 self.store_idp_url(idp_nickname=idp_nickname, idp_url=f'{input_idp_url}')
                 return idp_nickname, input_idp_url
 
     def store_idp_url(self, idp_nickname, idp_url):
-        self.credentials[idp_nickname] = {}
-        self.credentials[idp_nickname]["idp_url"] = idp_url
+        self.settings.reset(idp_nickname)
+        self.settings.set(idp_nickname, "idp_url", idp_url)
         self.store()
 
     def get_login(self, idp_nickname, use_stored):
        stored_login = ""
-       if idp_nickname in self.credentials and "login" in self.credentials[idp_nickname]:
-          stored_login = self.credentials[idp_nickname]["login"]
+       if self.settings.get(idp_nickname, "login") is not None:
+          stored_login = self.settings.get(idp_nickname, "login")
           if use_stored and stored_login != "":
               print(f'⚙️ Entering stored login {stored_login}')
               return stored_login
-       input_login = input(f"⌨️ Login [{stored_login}]: ")
+       input_login = ask(f"⌨️ Login [{stored_login}]: ")
        if input_login == "":
            if stored_login == "":
                return self.get_login(idp_nickname, use_stored=False)
@@ -147,22 +171,39 @@ class CustomConfigParser():
            return input_login
 
     def store_login(self, idp_nickname, login):
-        if idp_nickname not in self.credentials:
-            self.credentials[idp_nickname] = {}
-        self.credentials[idp_nickname]["login"] = login
+        self.settings.set(idp_nickname, "login", login)
         self.store()
 
+    def get_login_engine(self, idp_nickname):
+        # "http" or "browser" once a login went through for this identity provider, "auto" before
+        return self.settings.get(idp_nickname, "login_engine") or "auto"
+
+    def store_login_engine(self, idp_nickname, login_engine):
+        self.settings.set(idp_nickname, "login_engine", login_engine)
+        self.store()
+
+    def prefetch_password(self, idp_nickname):
+        # a keyring lookup is a D-Bus round trip to the Secret Service on Linux, it runs in the background
+        # while the user types the login
+        if idp_nickname not in self.password_lookups:
+            executor = ThreadPoolExecutor(max_workers=1)
+            self.password_lookups[idp_nickname] = executor.submit(lookup_password, idp_nickname)
+            executor.shutdown(wait=False)
+
+    def get_stored_password(self, idp_nickname):
+        if idp_nickname in self.password_lookups:
+            return self.password_lookups[idp_nickname].result()
+        return lookup_password(idp_nickname)
+
     def get_password(self, idp_nickname, use_stored):
-#        p = Popen(["secret-tool", "lookup", "idp_nickname", idp_nickname], stdout=PIPE)
-#        stored_password = p.stdout.read().decode('ascii') # remove trailing \n
-        stored_password = keyring.get_password('idp_nickname', idp_nickname)
+        stored_password = self.get_stored_password(idp_nickname)
         if use_stored and stored_password is not None:
               print(f'⚙️ Entering stored password {"*" * len(stored_password)}')
               return stored_password
         if stored_password is None:
             stored_password = ""
         displayed_password = "*" * len(stored_password)
-        input_password = getpass.getpass(f"⌨️ Password (type anything if you are passwordless) [{displayed_password}]: ")
+        input_password = ask(f"⌨️ Password (type anything if you are passwordless) [{displayed_password}]: ", secret=True)
         if input_password == "":
             if stored_password == "":
                 return self.get_password(idp_nickname, use_stored=False)
@@ -176,4 +217,22 @@ class CustomConfigParser():
 #        p = Popen(["secret-tool", "store", "--label='awscli_saml_sso'",
 #                   "idp_nickname", idp_nickname], stdout=PIPE, stdin=PIPE, stderr=PIPE)
 #        p.communicate(input=password.encode('ascii'))
+        import keyring
         keyring.set_password('idp_nickname', idp_nickname, password)
+        with _stored_passwords_lock:
+            stored_passwords[idp_nickname] = password
+        self.password_lookups.pop(idp_nickname, None)
+
+
+def lookup_password(idp_nickname):
+    # the keyring backend is only asked once per process for each identity provider
+    with _stored_passwords_lock:
+        if idp_nickname in stored_passwords:
+            return stored_passwords[idp_nickname]
+#    p = Popen(["secret-tool", "lookup", "idp_nickname", idp_nickname], stdout=PIPE)
+#    stored_password = p.stdout.read().decode('ascii') # remove trailing \n
+    import keyring
+    password = keyring.get_password('idp_nickname', idp_nickname)
+    with _stored_passwords_lock:
+        stored_passwords[idp_nickname] = password
+    return password
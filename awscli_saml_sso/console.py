@@ -0,0 +1,119 @@
+import getpass
+import sys
+import threading
+from contextlib import contextmanager
+
+# Terminal shared by logins running in parallel threads (see main.login_all): prompts are asked one at a time,
+# and lines printed by a login are prefixed with the nickname of its identity provider
+
+_prompt_lock = threading.Lock()
+_context = threading.local()
+
+
+def current_label():
+    return getattr(_context, "label", None)
+
+
+@contextmanager
+def labelled(label: str):
+    # output and prompts of the current thread are prefixed with label
+    previous = current_label()
+    _context.label = label
+    try:
+        yield
+    finally:
+        _context.label = previous
+
+
+def bind(function):
+    # function runs in another thread (browser started in background) with the label of the calling thread
+    label = current_label()
+
+    def labelled_function(*args, **kwargs):
+        with labelled(label):
+            return function(*args, **kwargs)
+    return labelled_function
+
+
+class LabelledOutput():
+    # stands for sys.stdout while several logins run: complete lines are written with the label of the thread
+    # printing them, and lines of other logins are held while a prompt waits for input.
+    # No fileno() on purpose, so that input() writes its prompt through write()
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.held = []
+        self.prompting = None
+
+    @property
+    def encoding(self):
+        return self.stream.encoding
+
+    def isatty(self):
+        return self.stream.isatty()
+
+    def labelled(self, text: str):
+        label = current_label()
+        return text if label is None else f"[{label}] {text}"
+
+    def emit(self, text: str):
+        if self.prompting is not None and self.prompting != threading.get_ident():
+            self.held.append(text)
+        else:
+            self.stream.write(text)
+
+    def write(self, text: str):
+        # print writes text and line end separately, lines are only written once complete
+        *lines, rest = (getattr(_context, "pending", "") + text).split("\n")
+        _context.pending = rest
+        with self.lock:
+            for line in lines:
+                self.emit(self.labelled(line) + "\n")
+        return len(text)
+
+    def flush(self):
+        rest = getattr(_context, "pending", "")
+        _context.pending = ""
+        with self.lock:
+            if rest != "":
+                self.emit(self.labelled(rest))
+            self.stream.flush()
+
+    def start_prompt(self):
+        with self.lock:
+            self.prompting = threading.get_ident()
+
+    def end_prompt(self):
+        with self.lock:
+            self.prompting = None
+            self.stream.writelines(self.held)
+            self.held = []
+            self.stream.flush()
+
+
+@contextmanager
+def shared_console():
+    output = LabelledOutput(sys.stdout)
+    sys.stdout = output
+    try:
+        yield output
+    finally:
+        sys.stdout = output.stream
+
+
+def ask(prompt: str, secret: bool = False):
+    # one prompt at a time, so that a MFA code typed in goes to the login that asked for it
+    with _prompt_lock:
+        output = sys.stdout if isinstance(sys.stdout, LabelledOutput) else None
+        if output is not None:
+            output.start_prompt()
+        try:
+            if secret:
+                # getpass writes to the terminal itself, not through sys.stdout
+                label = current_label()
+                return getpass.getpass(prompt if label is None else f"[{label}] {prompt}")
+            return input(prompt)
+        finally:
+            if output is not None:
+                output.end_prompt()
@@ -0,0 +1,123 @@
+import hmac
+import json
+import logging
+import secrets
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import environ
+
+logger = logging.getLogger(__name__)
+
+# credentials_path: Path of the served credentials, part of AWS_CONTAINER_CREDENTIALS_FULL_URI
+credentials_path = "/credentials"
+
+# refresh_retry_delay: Seconds before trying again a refresh that failed, while served credentials are still valid,
+# and shortest time between two refreshes
+refresh_retry_delay = 60
+
+
+def expiration_time(credentials: dict):
+    expiration = credentials["Expiration"]
+    if isinstance(expiration, str):
+        expiration = datetime.fromisoformat(expiration.replace("Z", "+00:00"))
+    return expiration
+
+
+def container_credentials(credentials: dict, role_arn: str):
+    # https://docs.aws.amazon.com/sdkref/latest/guide/feature-container-credentials.html
+    return json.dumps({
+        "AccessKeyId": credentials["AccessKeyId"],
+        "SecretAccessKey": credentials["SecretAccessKey"],
+        "Token": credentials["SessionToken"],
+        "Expiration": expiration_time(credentials).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "RoleArn": role_arn,
+    }).encode("utf8")
+
+
+class CredentialServer(ThreadingHTTPServer):
+    # serves the credentials of a role to local SDK clients from memory, and renews them ahead of expiry:
+    # refresh() logs in again, reusing the cached SAML assertion or the browser session of the identity provider
+    daemon_threads = True
+    # hundreds of SDK processes starting at once connect at the same time
+    request_queue_size = 256
+
+    def __init__(self, port: int, role_arn: str, credentials: dict, refresh, refresh_margin: int, token: str = None):
+        super().__init__(("127.0.0.1", port), CredentialRequestHandler)
+        self.role_arn = role_arn
+        self.refresh = refresh
+        self.refresh_margin = refresh_margin
+        self.token = token or environ.get("ASS_SERVE_TOKEN") or secrets.token_urlsafe(32)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.update(credentials)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}{credentials_path}"
+
+    def update(self, credentials: dict):
+        # response body is built once per refresh, not once per request
+        body = container_credentials(credentials, self.role_arn)
+        with self.lock:
+            self.expiration = expiration_time(credentials)
+            self.body = body
+
+    def current(self):
+        with self.lock:
+            return self.body, self.expiration
+
+    def refresh_loop(self):
+        renewed = False
+        while not self.stopped.is_set():
+            _, expiration = self.current()
+            remaining = (expiration - datetime.now(timezone.utc)).total_seconds()
+            delay = remaining - self.refresh_margin
+            if renewed:
+                # a margin as long as the credentials lifetime would renew them again right away: renewed
+                # credentials are served for half their lifetime, and refresh_retry_delay, at least
+                delay = max(delay, remaining / 2, refresh_retry_delay)
+            if self.stopped.wait(max(delay, 0)):
+                return
+            try:
+                self.update(self.refresh())
+                renewed = True
+                print(f"🔄 Credentials of {self.role_arn} renewed, they expire at {self.current()[1]}")
+            except (Exception, SystemExit) as e:
+                print(f"❌ Could not renew credentials of {self.role_arn}: {e}")
+                self.stopped.wait(refresh_retry_delay)
+
+    def serve(self):
+        refresher = threading.Thread(target=self.refresh_loop, name="credentials-refresh", daemon=True)
+        refresher.start()
+        try:
+            self.serve_forever()
+        finally:
+            self.stopped.set()
+            self.server_close()
+
+
+class CredentialRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive, so that SDK clients polling credentials reuse their connection
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path != credentials_path:
+            return self.reply(404, b'{"message": "not found"}')
+        # any local process can connect, only those given the token get credentials
+        if not hmac.compare_digest(self.headers.get("Authorization", "").encode("utf8"), self.server.token.encode("utf8")):
+            return self.reply(401, b'{"message": "unauthorized"}')
+        body, expiration = self.server.current()
+        if expiration <= datetime.now(timezone.utc):
+            return self.reply(503, b'{"message": "credentials expired, renewal failed"}')
+        self.reply(200, body)
+
+    def reply(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
@@ -0,0 +1,204 @@
+import builtins
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from hashlib import md5
+
+import click
+
+from awscli_saml_sso.config_parser import CONFIG_FOLDER
+from awscli_saml_sso.console import ask
+
+DAEMON_FOLDER = CONFIG_FOLDER / "daemon"
+
+# default_idle_timeout: Seconds without any login after which the daemon closes its browser and exits
+default_idle_timeout = int(os.environ.get("ASS_DAEMON_IDLE_TIMEOUT", 900))
+
+# daemon_start_timeout: Seconds to wait for a newly spawned daemon to listen on its socket
+daemon_start_timeout = 60
+
+
+def socket_path(idp_nickname: str):
+    return DAEMON_FOLDER / f"{md5(idp_nickname.encode('utf8')).hexdigest()}.sock"
+
+
+def send(channel, **message):
+    channel.write(json.dumps(message) + "\n")
+    channel.flush()
+
+
+def receive(channel):
+    line = channel.readline()
+    if line == "":
+        raise SystemExit("❌ Connection to the browser daemon was lost, " + "please try again")
+    return json.loads(line)
+
+
+class RemoteOutput():
+    # file-like object forwarding what the login flow prints to the client terminal
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def write(self, text):
+        if text != "":
+            send(self.channel, print=text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def start_daemon(idp_nickname: str, offline: bool):
+    DAEMON_FOLDER.mkdir(mode=0o700, parents=True, exist_ok=True)
+    log_file = DAEMON_FOLDER / f"{md5(idp_nickname.encode('utf8')).hexdigest()}.log"
+    command = [sys.executable, "-m", "awscli_saml_sso.daemon", f"--idp-nickname={idp_nickname}"]
+    if offline:
+        command.append("--offline")
+    print(f"⚙️ Starting browser daemon for {idp_nickname}")
+    with open(log_file.as_posix(), "a") as log:
+        # detached from the terminal so that it outlives current command
+        subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+
+
+def connect(idp_nickname: str, offline: bool):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path(idp_nickname).as_posix())
+        return client
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass
+    start_daemon(idp_nickname, offline)
+    deadline = time.monotonic() + daemon_start_timeout
+    while time.monotonic() < deadline:
+        try:
+            client.connect(socket_path(idp_nickname).as_posix())
+            return client
+        except (FileNotFoundError, ConnectionRefusedError):
+            time.sleep(0.1)
+    raise SystemExit(f"❌ Browser daemon did not start within {daemon_start_timeout} seconds, "
+                     f"see {DAEMON_FOLDER} logs or run without --daemon")
+
+
+def login_with_daemon(idp_nickname: str, idp_login: str, idp_password: str, offline: bool):
+    # prompts of the login flow (MFA code) are answered from current terminal
+    with connect(idp_nickname, offline) as client, client.makefile("rw", encoding="utf8") as channel:
+        send(channel, idp_login=idp_login, idp_password=idp_password)
+        while True:
+            message = receive(channel)
+            if "print" in message:
+                print(message["print"], end="")
+            elif "input" in message:
+                send(channel, answer=ask(message["input"]))
+            elif "error" in message:
+                raise SystemExit(message["error"])
+            else:
+                return message["assertion"]
+
+
+def leave_login_page(browser):
+    # identity provider pages are left so that nothing keeps running between logins,
+    # returns False when the browser no longer answers and must be restarted
+    from selenium.common.exceptions import WebDriverException
+    try:
+        browser.get("about:blank")
+        return True
+    except WebDriverException as e:
+        print(f"⚠️ Browser did not leave the login page, restarting it: {e.msg}", flush=True)
+        return False
+
+
+def serve_login(channel, browser, config_parser, idp_nickname, idpentryurl):
+    # returns False when the browser must be restarted before the next login
+    from awscli_saml_sso.browser import run_login_flow
+    request = receive(channel)
+
+    def remote_input(prompt=""):
+        send(channel, input=prompt)
+        return receive(channel)["answer"]
+
+    # only one login at a time is served, so the flow can borrow the process wide print and input
+    builtin_input = builtins.input
+    builtins.input = remote_input
+    try:
+        with redirect_stdout(RemoteOutput(channel)):
+            assertion = run_login_flow(browser, config_parser, idp_nickname, idpentryurl,
+                                       first_time=False, use_browser=False,
+                                       idp_login=request["idp_login"], idp_password=request["idp_password"])
+        send(channel, assertion=assertion)
+    except SystemExit as e:
+        send(channel, error=str(e))
+    except Exception as e:
+        send(channel, error=f"❌ Browser daemon failed: {e}")
+    finally:
+        builtins.input = builtin_input
+        usable = leave_login_page(browser)
+    return usable
+
+
+@click.command()
+@click.option('--idp-nickname', required=True, help="Nickname of the identity provider URL")
+@click.option('--idle-timeout', type=int, default=default_idle_timeout,
+              help=f"Seconds without login after which the daemon exits (default: {default_idle_timeout})")
+@click.option('--offline', is_flag=True, help="Only use browser drivers already stored")
+def main(idp_nickname, idle_timeout, offline):
+    from awscli_saml_sso.browser import SupportedBrowsers, quit_browser, start_browser
+    from awscli_saml_sso.config_parser import CustomConfigParser
+
+    config_parser = CustomConfigParser()
+    if not config_parser.has_browser_details(idp_nickname):
+        raise SystemExit(f"❌ {idp_nickname} must be used once without --daemon")
+    idpentryurl = config_parser.settings.get(idp_nickname, "idp_url")
+    browser_name = config_parser.settings.get(idp_nickname, "browser_name")
+    user_data_dir = config_parser.settings.get(idp_nickname, "user_data_dir")
+    browser_kind = [bk for bk in SupportedBrowsers if bk.value["name"] == browser_name][0]
+
+    def launch():
+        # the browser runs on its own copy of the profile, so that logins without the daemon (or with a shown
+        # browser) can still use user_data_dir meanwhile
+        return start_browser(show_browser=False, browser_kind=browser_kind, user_data_dir=user_data_dir,
+                             offline=offline, profile_mode="snapshot")
+
+    # mkdir mode does not apply to an existing folder (created by an earlier version or by hand)
+    DAEMON_FOLDER.mkdir(mode=0o700, parents=True, exist_ok=True)
+    os.chmod(DAEMON_FOLDER.as_posix(), 0o700)
+    path = socket_path(idp_nickname)
+    if path.exists():
+        path.unlink()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    browser = launch()
+    try:
+        # socket is created readable and writable by current user only, never opened to others until a chmod
+        previous_umask = os.umask(0o077)
+        try:
+            server.bind(path.as_posix())
+        finally:
+            os.umask(previous_umask)
+        server.listen()
+        server.settimeout(idle_timeout)
+        print(f"⚙️ Browser daemon for {idp_nickname} listening on {path}", flush=True)
+        while True:
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                print(f"💤 No login for {idle_timeout} seconds, exiting", flush=True)
+                break
+            connection.settimeout(None)
+            with connection, connection.makefile("rw", encoding="utf8") as channel:
+                usable = serve_login(channel, browser, config_parser, idp_nickname, idpentryurl)
+            if not usable:
+                quit_browser(browser)
+                browser = launch()
+    finally:
+        server.close()
+        if path.exists():
+            path.unlink()
+        quit_browser(browser)
+
+
+if __name__ == "__main__":
+    main()
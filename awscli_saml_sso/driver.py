@@ -3,10 +3,11 @@ import re
 import subprocess
 import requests
 import platform
-import urllib.request
 from os import environ
 
-def get_google_chrome_driver():
+from awscli_saml_sso.driver_store import download_archive, extract_binary, load_index, resolve_version
+
+def get_google_chrome_driver(offline=False):
     _platform = sys.platform
 
     try:
@@ -32,16 +33,6 @@ def get_google_chrome_driver():
     else:
         major_version = match.group(1)
 
-    # TODO read this instead : https://googlechromelabs.github.io/chrome-for-testing/last-known-good-versions-with-downloads.json
-    driver_version_base_url = environ.get("CHROME_DRIVER_VERISON_BASE_URL", "googlechromelabs.github.io/chrome-for-testing")
-    driver_version_url = f"https://{driver_version_base_url}/LATEST_RELEASE_{major_version}"
-    response = requests.get(driver_version_url)
-    if response.ok:
-        driver_version = response.text
-    else:
-        print("Could not get driver version suitbale for your Google Chrome version")
-        raise SystemExit
-
     os = "linux"
     arch = "64"
     if _platform == "darwin":
@@ -51,24 +42,37 @@ def get_google_chrome_driver():
         else:
             arch = "arm64"
 
-    driver_base_url = environ.get("CHROME_DRIVER_BASE_URL", "storage.googleapis.com/chrome-for-testing-public")
-    driver_url = f"https://{driver_base_url}/{driver_version}/{os}{arch}/chromedriver-{os}{arch}.zip"
+    def lookup():
+        # TODO read this instead : https://googlechromelabs.github.io/chrome-for-testing/last-known-good-versions-with-downloads.json
+        driver_version_base_url = environ.get("CHROME_DRIVER_VERISON_BASE_URL", "googlechromelabs.github.io/chrome-for-testing")
+        driver_version_url = f"https://{driver_version_base_url}/LATEST_RELEASE_{major_version}"
+        response = requests.get(driver_version_url)
+        if response.ok:
+            driver_version = response.text
+        else:
+            print("Could not get driver version suitbale for your Google Chrome version")
+            raise SystemExit
 
-    temporary_zip_file = "/tmp/chromedriver.zip"
-    driver_final_location = "/usr/local/bin/chromedriver"
+        driver_base_url = environ.get("CHROME_DRIVER_BASE_URL", "storage.googleapis.com/chrome-for-testing-public")
+        driver_url = f"https://{driver_base_url}/{driver_version}/{os}{arch}/chromedriver-{os}{arch}.zip"
+        return driver_version, driver_url
+
+    # version lookup and archive are kept in the local driver store, see driver_store.py
+    index = load_index()
+    entry = resolve_version(index, f"chromedriver/{os}{arch}/{major_version}", lookup, offline)
+    driver_url = entry["url"]
     try:
-        urllib.request.urlretrieve(driver_url, temporary_zip_file, )
+        archive = download_archive(index, driver_url, offline)
     except Exception as e:
         print(f"Could not download Google Chrome driver from {driver_url}: {str(e)}")
         raise SystemExit
 
-    import zipfile
-    with zipfile.ZipFile(temporary_zip_file,"r") as zip_ref:
-        zip_ref.extractall("/tmp")
+    driver_binary = extract_binary(archive, "chromedriver")
+    driver_final_location = "/usr/local/bin/chromedriver"
 
     print(f"We need admin privileges to place driver in {driver_final_location}")
     move_driver_command = subprocess.run(["sudo",
-                                        "mv", f"/tmp/chromedriver-{os}{arch}/chromedriver",
+                                        "cp", driver_binary.as_posix(),
                                         driver_final_location])
     if move_driver_command.returncode != 0:
         print(f"Could not place driver in {driver_final_location}")
@@ -0,0 +1,197 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import tarfile
+import zipfile
+from hashlib import md5, sha256
+from os import environ
+
+from awscli_saml_sso.cache import read_json_file, write_json_file
+from awscli_saml_sso.config_parser import CONFIG_FOLDER
+
+logger = logging.getLogger(__name__)
+
+# DRIVERS_FOLDER: Local store of WebDriver binaries, named after the sha256 of their archive. Driver vendors do not
+# publish digests, archives are checked with their own CRCs when downloaded and against the stored sha256 before
+# being extracted
+DRIVERS_FOLDER = CONFIG_FOLDER / "drivers"
+DRIVERS_INDEX_FILE = DRIVERS_FOLDER / "index.json"
+
+# driver_version_ttl: Seconds during which a driver version looked up for a browser major version is trusted
+# without querying the LATEST_RELEASE url again
+driver_version_ttl = int(environ.get("ASS_DRIVER_VERSION_TTL", 24 * 3600))
+
+# download_chunk_size: Bytes written at once while downloading a driver archive
+download_chunk_size = 64 * 1024
+
+# logins running in parallel threads (--idp-nicknames) resolve their driver one after the other,
+# the first one downloads it and the next ones find it in the store
+_install_lock = threading.Lock()
+
+
+def load_index():
+    index = read_json_file(DRIVERS_INDEX_FILE)
+    return index if index is not None else {"versions": {}, "archives": {}}
+
+
+def resolve_version(index: dict, key: str, lookup, offline: bool):
+    # lookup returns the driver version and its download url, it is only called
+    # when the stored one is older than driver_version_ttl
+    entry = index["versions"].get(key)
+    if entry is not None and (offline or time.time() - entry["resolved_at"] < driver_version_ttl):
+        logger.info(f"Driver version for {key} is {entry['version']} (resolved {int(time.time() - entry['resolved_at'])}s ago)")
+        return entry
+    if offline:
+        raise SystemExit(f"🛑 No driver version known for {key} in offline mode, please run once online")
+    version, url = lookup()
+    entry = {"version": version, "url": url, "resolved_at": time.time()}
+    index["versions"][key] = entry
+    write_json_file(DRIVERS_INDEX_FILE, index)
+    logger.info(f"Driver version for {key} resolved to {version}")
+    return entry
+
+
+def archive_suffix(url: str):
+    # geckodriver ships .tar.gz archives on Linux and macOS, other drivers zip files
+    return ".tar.gz" if url.endswith((".tar.gz", ".tgz")) else ".zip"
+
+
+def file_checksum(path):
+    digest = sha256()
+    with open(path.as_posix(), "rb") as fp:
+        for chunk in iter(lambda: fp.read(download_chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_valid_archive(path, suffix: str):
+    # every byte of the archive is checked against the CRCs it carries, which catches truncated downloads
+    # and resumed ones glued to a different file
+    try:
+        if suffix == ".zip":
+            if not zipfile.is_zipfile(path.as_posix()):
+                return False
+            with zipfile.ZipFile(path.as_posix(), "r") as zip_ref:
+                return zip_ref.testzip() is None
+        import gzip
+        with gzip.open(path.as_posix(), "rb") as fp:
+            while fp.read(download_chunk_size):
+                pass
+        return tarfile.is_tarfile(path.as_posix())
+    except (OSError, EOFError, zipfile.BadZipFile):
+        return False
+
+
+def download_archive(index: dict, url: str, offline: bool):
+    # archives are stored under their sha256 so that a given url is downloaded only once,
+    # partial downloads are resumed with an HTTP range request and published with an atomic rename
+    suffix = archive_suffix(url)
+    checksum = index["archives"].get(url)
+    if checksum is not None and (DRIVERS_FOLDER / "archives" / f"{checksum}{suffix}").exists():
+        return DRIVERS_FOLDER / "archives" / f"{checksum}{suffix}"
+    if offline:
+        raise SystemExit(f"🛑 Driver archive {url} is not stored locally in offline mode, please run once online")
+
+    import requests
+    (DRIVERS_FOLDER / "archives").mkdir(mode=0o700, parents=True, exist_ok=True)
+    partial = DRIVERS_FOLDER / "archives" / f"{md5(url.encode('utf8')).hexdigest()}.part"
+    # validator (ETag or Last-Modified) of the file the partial download is part of
+    validator_file = partial.with_suffix(".validator")
+    offset = partial.stat().st_size if partial.exists() else 0
+    validator = validator_file.read_text() if offset > 0 and validator_file.exists() else None
+    # a resumed download must continue the same file: If-Range makes the server send the whole new file
+    # instead of a range when it changed, and without validator the download starts over
+    headers = {"Range": f"bytes={offset}-", "If-Range": validator} if validator else {}
+    print(f"⚙️ Downloading driver from {url}")
+    with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+        if response.status_code == 416:
+            # range not satisfiable: partial file is already complete
+            pass
+        else:
+            response.raise_for_status()
+            # server may ignore the range request and send the whole file again
+            mode = "ab" if response.status_code == 206 else "wb"
+            if mode == "wb":
+                response_validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+                if response_validator is not None:
+                    validator_file.write_text(response_validator)
+                elif validator_file.exists():
+                    validator_file.unlink()
+            with open(partial.as_posix(), mode) as fp:
+                for chunk in response.iter_content(chunk_size=download_chunk_size):
+                    fp.write(chunk)
+                fp.flush()
+                os.fsync(fp.fileno())
+
+    if not is_valid_archive(partial, suffix):
+        partial.unlink()
+        raise SystemExit(f"🛑 Downloaded driver archive from {url} is corrupted, please try again")
+    if validator_file.exists():
+        validator_file.unlink()
+    checksum = file_checksum(partial)
+    archive = DRIVERS_FOLDER / "archives" / f"{checksum}{suffix}"
+    os.replace(partial.as_posix(), archive.as_posix())
+    index["archives"][url] = checksum
+    write_json_file(DRIVERS_INDEX_FILE, index)
+    return archive
+
+
+def extract_binary(archive, binary_name: str):
+    # binary lives in a folder named after the archive checksum, extracted once then reused
+    checksum = archive.name.split(".")[0]
+    binary = DRIVERS_FOLDER / checksum / binary_name
+    if binary.exists():
+        return binary
+    if file_checksum(archive) != checksum:
+        # altered since it was stored, it is downloaded again next time
+        archive.unlink()
+        raise SystemExit(f"🛑 Stored driver archive {archive} is corrupted, please try again")
+    temporary = DRIVERS_FOLDER / f"{checksum}.{os.getpid()}.tmp"
+    shutil.rmtree(temporary.as_posix(), ignore_errors=True)
+    temporary.mkdir(parents=True)
+    if archive.name.endswith(".tar.gz"):
+        with tarfile.open(archive.as_posix(), "r:gz") as tar_ref:
+            members = [member for member in tar_ref.getmembers()
+                       if member.isfile() and os.path.basename(member.name) == binary_name]
+            if len(members) == 0:
+                raise SystemExit(f"🛑 Could not find {binary_name} in driver archive {archive}")
+            with tar_ref.extractfile(members[0]) as source, open((temporary / binary_name).as_posix(), "wb") as target:
+                shutil.copyfileobj(source, target)
+    else:
+        with zipfile.ZipFile(archive.as_posix(), "r") as zip_ref:
+            members = [member for member in zip_ref.namelist() if os.path.basename(member) == binary_name]
+            if len(members) == 0:
+                raise SystemExit(f"🛑 Could not find {binary_name} in driver archive {archive}")
+            with zip_ref.open(members[0]) as source, open((temporary / binary_name).as_posix(), "wb") as target:
+                shutil.copyfileobj(source, target)
+    os.chmod((temporary / binary_name).as_posix(), 0o755)
+    try:
+        os.rename(temporary.as_posix(), (DRIVERS_FOLDER / checksum).as_posix())
+    except OSError:
+        # another process extracted the same archive meanwhile
+        shutil.rmtree(temporary.as_posix(), ignore_errors=True)
+    return binary
+
+
+def install_driver(driver_manager, offline: bool = False):
+    # replaces driver_manager.install() that queries LATEST_RELEASE url on every call
+    driver = driver_manager.driver
+    os_type = driver_manager.get_os_type()
+    browser_version = driver.get_browser_version_from_os()
+    if browser_version is None:
+        raise SystemExit(f"🛑 Unable to find browser version for {driver.get_name()}, please install it first")
+    key = f"{driver.get_name()}/{os_type}/{browser_version.split('.')[0]}"
+
+    def lookup():
+        driver_version = driver.get_driver_version_to_download()
+        # pin version so that building download url does not trigger another lookup
+        driver._driver_version_to_download = driver_version
+        return driver_version, driver.get_driver_download_url(os_type)
+
+    with _install_lock:
+        index = load_index()
+        entry = resolve_version(index, key, lookup, offline)
+        archive = download_archive(index, entry["url"], offline)
+        return extract_binary(archive, driver.get_binary_name(os_type)).as_posix()
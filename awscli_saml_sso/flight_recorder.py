@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from os import environ
+from time import monotonic
+
+from awscli_saml_sso.config_parser import CONFIG_FOLDER
+
+# RECORDINGS_FOLDER: Bundles written when a browser login fails, to be sent to support
+RECORDINGS_FOLDER = CONFIG_FOLDER / "recordings"
+
+# capacity: Last transitions of the login flow kept in memory, ASS_FLIGHT_RECORDER_SIZE=0 disables recording
+capacity = int(environ.get("ASS_FLIGHT_RECORDER_SIZE", "32"))
+
+# snippet_length: Characters of the form each state was found in, trimmed by the browser itself
+# so that only that much crosses the WebDriver connection
+snippet_length = int(environ.get("ASS_FLIGHT_RECORDER_SNIPPET", "2048"))
+
+# max_recordings: Bundles kept in RECORDINGS_FOLDER, older ones are removed
+max_recordings = 20
+
+# page_source_script: Source of the final page without values of hidden and password inputs, as snippets
+page_source_script = """
+var copy = document.documentElement.cloneNode(true);
+copy.querySelectorAll("input[type=hidden], input[type=password]").forEach(function(input) {
+    input.removeAttribute("value");
+});
+return copy.outerHTML;
+"""
+
+
+class FlightRecorder():
+    # ring buffer of the states a browser login went through, filled by page_states.wait_for_state from what its
+    # detection script returns anyway, written to disk by dump() only when the login fails
+
+    def __init__(self, idp_nickname: str):
+        self.idp_nickname = idp_nickname
+        self.transitions = deque(maxlen=max(capacity, 1))
+        self.started = monotonic()
+        self.last = self.started
+
+    @property
+    def snippet_length(self):
+        return snippet_length if capacity > 0 else 0
+
+    def record(self, state: str, url: str = None, snippet: str = None):
+        now = monotonic()
+        self.transitions.append({
+            "state": state,
+            "offset": round(now - self.started, 3),
+            "seconds": round(now - self.last, 3),
+            "url": url,
+            "snippet": snippet,
+        })
+        self.last = now
+
+    def dump(self, browser, reason: str):
+        # transitions and the final page, gzipped JSON readable by current user only
+        page = {"url": None, "source": None}
+        try:
+            page = {"url": browser.current_url, "source": browser.execute_script(page_source_script)}
+        except Exception:
+            # browser closed or crashed, transitions are still worth it
+            pass
+        bundle = {
+            "reason": reason,
+            "idp_nickname": self.idp_nickname,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "duration": round(monotonic() - self.started, 3),
+            "transitions": list(self.transitions) if capacity > 0 else [],
+            "page": page,
+        }
+        RECORDINGS_FOLDER.mkdir(mode=0o700, parents=True, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{self.idp_nickname}_{reason}")
+        target = RECORDINGS_FOLDER / f"{name}_{os.getpid()}_{threading.get_ident()}.json.gz"
+        fd = os.open(target.as_posix(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf8") as fp:
+            json.dump(bundle, fp)
+        remove_old_recordings()
+        print(f"💾 Saved login recording {reason} to {target}, you can send it to support")
+        return target
+
+
+def remove_old_recordings():
+    try:
+        recordings = sorted(RECORDINGS_FOLDER.glob("*.json.gz"), key=lambda path: path.stat().st_mtime, reverse=True)
+    except FileNotFoundError:
+        # removed meanwhile by another failed login
+        return
+    for recording in recordings[max_recordings:]:
+        try:
+            recording.unlink()
+        except FileNotFoundError:
+            pass
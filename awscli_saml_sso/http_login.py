@@ -0,0 +1,175 @@
+import logging
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from awscli_saml_sso.cache import read_cache, write_cache
+from awscli_saml_sso.console import ask
+from awscli_saml_sso.timings import timer
+
+logger = logging.getLogger(__name__)
+
+# http_timeout: Seconds to wait for each identity provider response
+http_timeout = 30
+
+# max_steps: Forms submitted before giving up, login form and MFA plus a few intermediate pages
+max_steps = 10
+
+# username_names: Names of the username input of known login forms (Keycloak, ADFS, Shibboleth, ...)
+username_names = ["username", "UserName", "j_username", "loginfmt", "email"]
+
+# otp_names: Names of the one time code input of known MFA forms
+otp_names = ["otp", "totp", "otc", "code", "VerificationCode"]
+
+
+class HttpLoginUnsupported(Exception):
+    # identity provider pages need a browser (JavaScript driven login such as Microsoft Entra)
+    pass
+
+
+class FormParser(HTMLParser):
+    # collects forms with their inputs, enough to replay what a browser would submit
+
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self.form = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form":
+            self.form = {"action": attrs.get("action") or "", "method": (attrs.get("method") or "get").lower(),
+                         "inputs": []}
+            self.forms.append(self.form)
+        elif tag in ("input", "button") and self.form is not None:
+            self.form["inputs"].append({"name": attrs.get("name"),
+                                        "type": (attrs.get("type") or ("submit" if tag == "button" else "text")).lower(),
+                                        "value": attrs.get("value") or "",
+                                        "checked": "checked" in attrs})
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self.form = None
+
+
+def parse_forms(html: str):
+    parser = FormParser()
+    parser.feed(html)
+    return parser.forms
+
+
+def form_fields(form: dict):
+    # values a browser submits without any user input: hidden and prefilled fields, checked boxes
+    # and the first named submit button
+    fields, submitted = {}, False
+    for field in form["inputs"]:
+        if field["name"] is None:
+            continue
+        if field["type"] in ("checkbox", "radio"):
+            if field["checked"]:
+                fields[field["name"]] = field["value"] or "on"
+        elif field["type"] in ("submit", "image"):
+            if not submitted:
+                fields[field["name"]] = field["value"]
+                submitted = True
+        elif field["type"] not in ("reset", "file"):
+            fields[field["name"]] = field["value"]
+    return fields
+
+
+def find_input(form: dict, names: list, types: list):
+    for field in form["inputs"]:
+        if field["name"] in names and field["type"] not in ("hidden", "submit", "button"):
+            return field["name"]
+    for field in form["inputs"]:
+        if field["name"] is not None and field["type"] in types:
+            return field["name"]
+    return None
+
+
+def load_cookies(session, idp_nickname: str):
+    for cookie in read_cache("cookies", idp_nickname) or []:
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"],
+                            expires=cookie["expires"], secure=cookie["secure"])
+
+
+def store_cookies(session, idp_nickname: str):
+    # identity provider session cookies let next logins skip the login form while the SSO session lasts
+    session.cookies.clear_expired_cookies()
+    write_cache("cookies", idp_nickname, [{"name": cookie.name, "value": cookie.value, "domain": cookie.domain,
+                                           "path": cookie.path, "expires": cookie.expires, "secure": cookie.secure}
+                                          for cookie in session.cookies])
+
+
+def new_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    # connections to the identity provider are kept alive between the steps of the login
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) awscli_saml_sso"
+    return session
+
+
+def login_with_http(idp_nickname: str, idpentryurl: str, idp_login: str, idp_password: str):
+    # replays plain HTML login forms (Keycloak, ADFS forms authentication) without a browser:
+    # fill in login and password, ask for a one time code if a MFA form shows up, submit intermediate
+    # auto-submit forms, until the form posting SAMLResponse to AWS is reached
+    import requests
+    session = new_session()
+    load_cookies(session, idp_nickname)
+    password_submitted = False
+    try:
+        with timer("idp page load"):
+            response = session.get(idpentryurl, timeout=http_timeout)
+            response.raise_for_status()
+        for _ in range(max_steps):
+            forms = parse_forms(response.text)
+            for form in forms:
+                for field in form["inputs"]:
+                    if field["name"] == "SAMLResponse":
+                        logger.info(f"SAMLResponse found in form posting to {form['action']}")
+                        return field["value"]
+            if len(forms) == 0:
+                raise HttpLoginUnsupported(f"no HTML form on {response.url}")
+
+            form = forms[0]
+            fields = form_fields(form)
+            password_field = find_input(form, [], ["password"])
+            login_field = find_input(form, username_names, [])
+            otp_field = find_input(form, otp_names, [])
+            if password_field is not None:
+                if password_submitted:
+                    raise SystemExit("❌ Identity provider rejected your login or password, please try it all again")
+                if idp_login is None or idp_password is None:
+                    raise HttpLoginUnsupported("login and password are entered in the browser")
+                username_field = find_input(form, username_names, ["email", "text"])
+                if username_field is not None:
+                    fields[username_field] = idp_login
+                fields[password_field] = idp_password
+                password_submitted = True
+                print(f"⚙️ Submitting login and password to {response.url.split('?')[0]}")
+            elif login_field is not None and idp_login is not None:
+                # login alone first, password on next page
+                fields[login_field] = idp_login
+            elif otp_field is not None:
+                with timer("mfa code entry"):
+                    fields[otp_field] = ask("⌨️ Please enter MFA code: ")
+            elif any(field["type"] not in ("hidden", "submit") for field in form["inputs"] if field["name"] is not None):
+                raise HttpLoginUnsupported(f"unknown form on {response.url}")
+
+            # intermediate forms (ADFS or Keycloak redirections) are submitted as is
+            action = urljoin(response.url, form["action"])
+            with timer("idp response wait"):
+                if form["method"] == "post":
+                    response = session.post(action, data=fields, timeout=http_timeout)
+                else:
+                    response = session.get(action, params=fields, timeout=http_timeout)
+                response.raise_for_status()
+        raise HttpLoginUnsupported(f"no SAMLResponse after {max_steps} pages")
+    except requests.RequestException as e:
+        raise SystemExit(f"❌ Identity provider did not answer as expected: {e}")
+    finally:
+        store_cookies(session, idp_nickname)
+        session.close()
@@ -1,20 +1,27 @@
-import base64
-import configparser
+import json
 import logging
 import os
 import sys
-import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from fnmatch import fnmatch
 from pathlib import Path
-import boto3
 import click
-from logging.config import fileConfig
-from pkg_resources import resource_filename
-from h2.exceptions import StreamClosedError
 import threading
 import traceback
 
-from awscli_saml_sso.browser import login_and_get_assertion
+# heavy dependencies (boto3, selenium, seleniumwire, h2) are imported on the code path that needs them
+# so that --version, --clean and cache hits start fast, see benchmarks/startup.py
+from awscli_saml_sso import __path__ as module_path, __version__
+from awscli_saml_sso.assertion import get_aws_roles
+from awscli_saml_sso.aws_credentials import AWS_CREDENTIALS_FILE, profile_name, write_profiles
+from awscli_saml_sso.cache import get_cached_assertion, get_cached_credentials
 from awscli_saml_sso.config_parser import CustomConfigParser
+from awscli_saml_sso.profile_index import format_remaining, profile_entry, read_profiles, record_profiles, remaining_seconds
+from awscli_saml_sso import console
+from awscli_saml_sso.sts import assume_chained_roles, assume_role_with_saml, assume_roles_with_saml, default_max_workers
+from awscli_saml_sso import timings
+from awscli_saml_sso.timings import timer
 
 ##########################################################################
 # Variables
@@ -25,9 +32,17 @@ supported_log_levels = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
 # default_log_level: Default python log level to configure when not user provided
 default_log_level = "WARNING"
 
+# default_expiry_margin: Default seconds left before expiration under which cached credentials are renewed
+default_expiry_margin = 300
+
+# default_max_logins: Default number of identity providers logged in concurrently with --idp-nicknames,
+# each login may start its own browser
+default_max_logins = 4
+
 
 # https://superfastpython.com/thread-exception-handling/
 def custom_hook(args):
+    from h2.exceptions import StreamClosedError
     # ignore Exception in thread Http2SingleStreamLayer of type h2.exceptions.StreamClosedError
     if not isinstance(args.exc_value, StreamClosedError):
         print(f"Exception {args.exc_type} in thread {args.thread}:")
@@ -38,77 +53,54 @@ threading.excepthook = custom_hook
 ##########################################################################
 
 
-@click.command()
-@click.option("--log-level", envvar="ASS_LOG_LEVEL",
-              type=click.Choice(supported_log_levels, case_sensitive=False),
-              default=default_log_level,
-              help=f"Configure python log level to print (default: {default_log_level})")
-@click.option("--endpoint-url", envvar="ASS_ENDPOINT_URL",
-              help="Override AWS API endpoint url (mainly for testing purpose)")
-@click.option('--show-browser', is_flag=True, help="Do not use headless mode")
-@click.option('--use-browser', is_flag=True, help="Do not ask for input in CLI")
-@click.option('--idp-nickname', help="Nickname of the identity provider URL")
-@click.option('--use-stored', is_flag=True, help="Use stored values for username and password without prompt")
-@click.option('--role-selection', type=int, default=-1, help="Index of the role to select among available roles")
-@click.option('--clean', is_flag=True, help="Wipe out all stored information")
-@click.version_option()
-
-def main(log_level,
-         endpoint_url,
-         show_browser,
-         use_browser,
-         idp_nickname,
-         use_stored,
-         role_selection,
-         clean):
-    
-    if clean:
-        print("⚠️ Folder ~/.awscli_saml_sso will be renamed to ~/.awscli_saml_sso.OLD")
-        if input("❓ Proceed (y/n) ?")=="y":
-            CustomConfigParser.clean()
-            sys.exit(0)
-
-
+def configure_logging(log_level):
+    from logging.config import fileConfig
     os.environ["WDM_LOG_LEVEL"] = str(logging.getLevelName(log_level))
-    fileConfig(resource_filename("awscli_saml_sso", "logger.cfg"), disable_existing_loggers=False, defaults={
+    fileConfig(Path(module_path[0]) / "logger.cfg", disable_existing_loggers=False, defaults={
         "log_level": log_level,
     })
 
+
+def get_assertion(show_browser, use_browser, idp_nickname, use_stored, use_cache, offline, use_daemon=False,
+                  login_engine="auto"):
+    if use_cache and idp_nickname is not None:
+        assertion = get_cached_assertion(idp_nickname)
+        if assertion is not None:
+            print(f"✅ Reusing still valid SAML assertion for {idp_nickname}, no need to open browser")
+            return assertion, idp_nickname
+    from awscli_saml_sso.browser import login_and_get_assertion
     assertion, idp_nickname = login_and_get_assertion(show_browser=show_browser,
                                                       use_browser=use_browser,
                                                       idp_nickname=idp_nickname,
-                                                      use_stored=use_stored)
-
-    # Parse the returned assertion and extract the authorized roles
-    awsroles = []
-    root = ET.fromstring(base64.b64decode(assertion))
-    for saml2attribute in root.iter("{urn:oasis:names:tc:SAML:2.0:assertion}Attribute"):
-        if (saml2attribute.get("Name") == "https://aws.amazon.com/SAML/Attributes/Role"):
-            for saml2attributevalue in saml2attribute.iter("{urn:oasis:names:tc:SAML:2.0:assertion}AttributeValue"):
-                awsroles.append(saml2attributevalue.text)
-
-    # Note the format of the attribute value should be role_arn,principal_arn
-    # but lots of blogs list it as principal_arn,role_arn so let's reverse
-    # them if needed
-    for awsrole in awsroles:
-        chunks = awsrole.split(",")
-        if "saml-provider" in chunks[0]:
-            newawsrole = chunks[1] + "," + chunks[0]
-            index = awsroles.index(awsrole)
-            awsroles.insert(index, newawsrole)
-            awsroles.remove(awsrole)
+                                                      use_stored=use_stored,
+                                                      # cache was already looked up above when the nickname is known
+                                                      use_cache=use_cache and idp_nickname is None,
+                                                      offline=offline,
+                                                      use_daemon=use_daemon,
+                                                      login_engine=login_engine)
+    timings.annotate(idp_nickname=idp_nickname)
+    return assertion, idp_nickname
 
+
+def select_role(awsroles, role_selection, role_arn=None):
     # If I have more than one role, ask the user which one they want,
     # otherwise just proceed
     print("")
     if len(awsroles) == 0:
         print("❌ Your account is not associated to any role, can't continue.")
         sys.exit(0)
+
+    if role_arn is not None:
+        role_arns = [awsrole.role_arn for awsrole in awsroles]
+        if role_arn not in role_arns:
+            print(f"❌ Your account is not associated to role {role_arn}, can't continue.")
+            sys.exit(1)
+        selectedroleindex = role_arns.index(role_arn)
     else:
         i = 0
         print("⌨️ Please choose the role you would like to assume:")
         for awsrole in awsroles:
-            print("[", i, "]: ", awsrole.split(",")[0])
+            print("[", i, "]: ", awsrole.role_arn)
             i += 1
 
         if len(awsroles) == 1:
@@ -126,51 +118,389 @@ def main(log_level,
             print("🔄 You selected an invalid role index, please try again")
             sys.exit(0)
 
-        role_arn = awsroles[int(selectedroleindex)].split(",")[0]
-        principal_arn = awsroles[int(selectedroleindex)].split(",")[1]
+    role_arn = awsroles[int(selectedroleindex)].role_arn
+    principal_arn = awsroles[int(selectedroleindex)].principal_arn
+    return int(selectedroleindex), role_arn, principal_arn
+
+
+def filter_roles(awsroles, roles):
+    # roles is either "all" or a comma separated list of role ARNs or role names, glob patterns allowed
+    if roles == "all":
+        return awsroles
+    patterns = [pattern.strip() for pattern in roles.split(",") if pattern.strip() != ""]
+    return [awsrole for awsrole in awsroles
+            if any(fnmatch(awsrole.role_arn, pattern) or fnmatch(awsrole.role_arn.split("/")[-1], pattern)
+                   for pattern in patterns)]
+
+
+def assume_roles(idp_nickname, awsroles, roles, assertion, endpoint_url, max_workers):
+    selected_roles = filter_roles(awsroles, roles)
+    if len(selected_roles) == 0:
+        print(f"❌ None of your roles matches {roles}, can't continue.")
+        sys.exit(1)
+
+    print(f"⚙️ Assuming {len(selected_roles)} roles")
+    credentials, errors = assume_roles_with_saml(idp_nickname, selected_roles, assertion, endpoint_url, max_workers)
+    for role_arn, error in errors.items():
+        print(f"❌ Could not assume {role_arn}: {error}")
+
+    profiles = {profile_name(role_arn): role_credentials for role_arn, role_credentials in credentials.items()}
+    entries = {profile_name(role_arn): profile_entry(idp_nickname, role_arn, role_credentials)
+               for role_arn, role_credentials in credentials.items()}
+    store_profiles(profiles, entries, failed=len(errors) > 0)
+
+
+def chain_role_arns(chain_roles, chain_accounts):
+    # chain_roles is a comma separated list of role ARNs, {account_id} in one of them is replaced by each of
+    # chain_accounts: comma separated account ids, or @file with one account id per line
+    if chain_accounts is not None and chain_accounts.startswith("@"):
+        with open(os.path.expanduser(chain_accounts[1:]), "r") as fp:
+            accounts = [line.strip() for line in fp if line.strip() != "" and not line.startswith("#")]
+    else:
+        accounts = [account.strip() for account in (chain_accounts or "").split(",") if account.strip() != ""]
+    role_arns = []
+    for role_arn in (role_arn.strip() for role_arn in chain_roles.split(",") if role_arn.strip() != ""):
+        if "{account_id}" not in role_arn:
+            role_arns.append(role_arn)
+        elif len(accounts) == 0:
+            raise click.UsageError(f"--chain-accounts is required to expand {role_arn}")
+        else:
+            role_arns.extend(role_arn.replace("{account_id}", account) for account in accounts)
+    return list(dict.fromkeys(role_arns))
+
+
+def assume_chained(idp_nickname, role_arn, credentials, chain_roles, chain_accounts, endpoint_url, max_workers):
+    # SAML role is a hub role from which roles of member accounts are assumed, the SAML role
+    # profile and one profile per chained role are written at once
+    role_arns = chain_role_arns(chain_roles, chain_accounts)
+    print(f"⚙️ Assuming {len(role_arns)} chained roles")
+    chained_credentials, errors = assume_chained_roles(credentials, role_arns, endpoint_url, max_workers)
+    for role_arn, error in errors.items():
+        print(f"❌ Could not assume {role_arn}: {error}")
+
+    profiles = {"saml": credentials}
+    entries = {"saml": profile_entry(idp_nickname, role_arn, credentials)}
+    for chained_role_arn, role_credentials in chained_credentials.items():
+        profiles[profile_name(chained_role_arn)] = role_credentials
+        entries[profile_name(chained_role_arn)] = profile_entry(idp_nickname, chained_role_arn, role_credentials)
+    store_profiles(profiles, entries, failed=len(errors) > 0)
+
+
+def serve(role_arn, credentials, refresh, port, expiry_margin):
+    from awscli_saml_sso.credential_server import CredentialServer
+    server = CredentialServer(port, role_arn, credentials, refresh, expiry_margin)
+    print("\n----------------------------------------------------------------")
+    print(f"Credentials of {role_arn} are served until interrupted, renewed {expiry_margin} seconds before they expire.")
+    print("Set these variables in the environment of AWS CLI and SDK processes:")
+    print(f"export AWS_CONTAINER_CREDENTIALS_FULL_URI={server.url}")
+    print(f"export AWS_CONTAINER_AUTHORIZATION_TOKEN={server.token}")
+    print("----------------------------------------------------------------\n")
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        print("🛑 Credentials server stopped")
+
 
-    # Use the assertion to get an AWS STS token using Assume Role with SAML
-    client = boto3.client("sts", endpoint_url=endpoint_url)
-    sts_response = client.assume_role_with_saml(RoleArn=role_arn, PrincipalArn=principal_arn, SAMLAssertion=assertion)
+def store_profiles(profiles, entries, failed):
+    # entries are the profile index entries of profiles, see profile_index.record_profiles
+    with timer("credentials write"):
+        write_profiles(profiles)
+        record_profiles(entries)
 
-    # Write the AWS STS token into the AWS credential file
-    aws_credentials_path = Path.home() / ".aws" / "credentials"
+    print("\n----------------------------------------------------------------")
+    print(f"The following profiles have been stored in the AWS configuration file {AWS_CREDENTIALS_FILE}:")
+    for profile in sorted(profiles):
+        print(f"{profile} (expires at {profiles[profile]['Expiration']})")
+    print("----------------------------------------------------------------\n")
+    if failed:
+        sys.exit(1)
+    print("✅ Success !")
 
-    # Read in the existing config file
-    config = configparser.RawConfigParser()
-    config.read(aws_credentials_path)
 
-    # Put the credentials into a saml specific section instead of clobbering
-    # the default credentials
-    if not config.has_section("saml"):
-        config.add_section("saml")
+def login_idp(idp_nickname, roles, endpoint_url, max_workers, login_options):
+    # one of the logins of login_all, running in its own thread with its own browser and profile
+    with console.labelled(idp_nickname):
+        assertion, _ = get_assertion(idp_nickname=idp_nickname, **login_options)
+        selected_roles = filter_roles(get_aws_roles(assertion), roles)
+        if len(selected_roles) == 0:
+            print(f"❌ None of your roles matches {roles}")
+            return {}, {}, {}
+        print(f"⚙️ Assuming {len(selected_roles)} roles")
+        credentials, errors = assume_roles_with_saml(idp_nickname, selected_roles, assertion, endpoint_url,
+                                                     max_workers)
+        for role_arn, error in errors.items():
+            print(f"❌ Could not assume {role_arn}: {error}")
+        profiles = {profile_name(role_arn): role_credentials for role_arn, role_credentials in credentials.items()}
+        entries = {profile_name(role_arn): profile_entry(idp_nickname, role_arn, role_credentials)
+                   for role_arn, role_credentials in credentials.items()}
+        return profiles, entries, errors
+
+
+def login_all(idp_nicknames, roles, endpoint_url, max_workers, max_logins, login_options):
+    # idp_nicknames is either "all" or a comma separated list of stored identity provider nicknames.
+    # Up to max_logins logins run at the same time, prompts are asked one at a time, and all profiles are written
+    # at once
+    stored_nicknames = CustomConfigParser().settings.nicknames()
+    if idp_nicknames == "all":
+        nicknames = stored_nicknames
+    else:
+        nicknames = list(dict.fromkeys(nickname.strip() for nickname in idp_nicknames.split(",")
+                                       if nickname.strip() != ""))
+    unknown_nicknames = [nickname for nickname in nicknames if nickname not in stored_nicknames]
+    if len(unknown_nicknames) > 0:
+        raise click.UsageError(f"Unknown identity provider nicknames: {', '.join(unknown_nicknames)}")
+    if len(nicknames) == 0:
+        raise click.UsageError("No identity provider to log in to")
 
-    config.set("saml", "aws_access_key_id", sts_response["Credentials"]["AccessKeyId"])
-    config.set("saml", "aws_secret_access_key", sts_response["Credentials"]["SecretAccessKey"])
-    config.set("saml", "aws_session_token", sts_response["Credentials"]["SessionToken"])
-    config.set("saml", "aws_security_token", sts_response["Credentials"]["SessionToken"])
+    print(f"⚙️ Logging in to {len(nicknames)} identity providers: {', '.join(nicknames)}")
+    profiles, entries, failed = {}, {}, False
+    with console.shared_console(), ThreadPoolExecutor(max_workers=min(max_logins, len(nicknames))) as executor:
+        futures = {executor.submit(login_idp, nickname, roles, endpoint_url, max_workers, login_options): nickname
+                   for nickname in nicknames}
+        for future in as_completed(futures):
+            try:
+                idp_profiles, idp_entries, errors = future.result()
+            except (Exception, SystemExit) as e:
+                # a failed login does not prevent the others from being stored
+                print(f"❌ Login to {futures[future]} failed: {e}")
+                failed = True
+                continue
+            for profile in idp_profiles:
+                if profile in profiles:
+                    print(f"⚠️ Profile {profile} of {futures[future]} replaces the one of another identity provider")
+            profiles.update(idp_profiles)
+            entries.update(idp_entries)
+            failed = failed or len(errors) > 0 or len(idp_profiles) == 0
+    store_profiles(profiles, entries, failed)
 
-    # Write the updated config file
-    with aws_credentials_path.open(mode="w+") as configfile:
-        config.write(configfile)
+
+def report_timings(show_timings, timings_file, file):
+    if show_timings:
+        timings.print_report(file=file)
+    if timings_file is not None:
+        timings.write_record(timings_file)
+
+
+def cached_role_credentials(idp_nickname, role_arn, role_selection, no_cache, expiry_margin, endpoint_url, log_level,
+                            login_options):
+    # credentials of role_arn from the local cache, the login only runs when they expire within expiry_margin.
+    # Its output goes to stderr, stdout is reserved to the caller (credential_process JSON, exec command)
+    credentials = None if no_cache else get_cached_credentials(idp_nickname, role_arn, expiry_margin)
+    if credentials is None:
+        with redirect_stdout(sys.stderr):
+            configure_logging(log_level)
+            assertion, idp_nickname = get_assertion(idp_nickname=idp_nickname, use_cache=not no_cache, **login_options)
+            _, role_arn, principal_arn = select_role(get_aws_roles(assertion), role_selection, role_arn)
+            credentials = assume_role_with_saml(idp_nickname, role_arn, principal_arn, assertion, endpoint_url)
+    return credentials
+
+
+def credential_process_output(credentials):
+    # https://docs.aws.amazon.com/sdkref/latest/guide/feature-process-credentials.html
+    expiration = credentials["Expiration"]
+    return {
+        "Version": 1,
+        "AccessKeyId": credentials["AccessKeyId"],
+        "SecretAccessKey": credentials["SecretAccessKey"],
+        "SessionToken": credentials["SessionToken"],
+        "Expiration": expiration if isinstance(expiration, str) else expiration.isoformat(),
+    }
+
+
+@click.group(invoke_without_command=True)
+@click.option("--log-level", envvar="ASS_LOG_LEVEL",
+              type=click.Choice(supported_log_levels, case_sensitive=False),
+              default=default_log_level,
+              help=f"Configure python log level to print (default: {default_log_level})")
+@click.option("--endpoint-url", envvar="ASS_ENDPOINT_URL",
+              help="Override AWS API endpoint url (mainly for testing purpose)")
+@click.option('--show-browser', is_flag=True, help="Do not use headless mode")
+@click.option('--use-browser', is_flag=True, help="Do not ask for input in CLI")
+@click.option('--idp-nickname', help="Nickname of the identity provider URL")
+@click.option('--idp-nicknames',
+              help="Log in to several identity providers at once and write the profiles of all of them: "
+                   "'all' or comma separated nicknames, roles are selected with --roles (default: all)")
+@click.option('--use-stored', is_flag=True, help="Use stored values for username and password without prompt")
+@click.option('--role-selection', type=int, default=-1, help="Index of the role to select among available roles")
+@click.option('--role-arn', help="ARN of the role to select among available roles")
+@click.option('--roles',
+              help="Assume several roles at once and write one profile per role: "
+                   "'all' or comma separated role ARNs or names, glob patterns allowed")
+@click.option('--chain-roles', envvar="ASS_CHAIN_ROLES",
+              help="Assume these roles from the selected role and write one profile per role: comma separated "
+                   "role ARNs, {account_id} in an ARN is replaced by each of --chain-accounts")
+@click.option('--chain-accounts', envvar="ASS_CHAIN_ACCOUNTS",
+              help="Account ids replacing {account_id} in --chain-roles: comma separated, or @file with one per line")
+@click.option('--max-workers', type=click.IntRange(1), default=default_max_workers,
+              help=f"Number of roles assumed concurrently with --roles or --chain-roles (default: {default_max_workers})")
+@click.option('--max-logins', envvar="ASS_MAX_LOGINS", type=click.IntRange(1), default=default_max_logins,
+              help=f"Number of identity providers logged in concurrently with --idp-nicknames "
+                   f"(default: {default_max_logins})")
+@click.option('--clean', is_flag=True, help="Wipe out all stored information")
+@click.option('--no-cache', is_flag=True, help="Do not reuse a cached SAML assertion, always log in again")
+@click.option('--credential-process', is_flag=True,
+              help="Print credentials as JSON for AWS credential_process, requires --idp-nickname and --role-arn")
+@click.option('--expiry-margin', envvar="ASS_EXPIRY_MARGIN", type=int, default=default_expiry_margin,
+              help=f"Seconds left before expiration under which cached credentials are renewed (default: {default_expiry_margin})")
+@click.option('--offline', is_flag=True, envvar="ASS_OFFLINE",
+              help="Only use browser drivers already stored in ~/.awscli_saml_sso/drivers, never download them")
+@click.option('--timings', 'show_timings', is_flag=True, help="Print how long each phase of the login took")
+@click.option('--timings-file', envvar="ASS_TIMINGS_FILE",
+              help="Append phase timings of each run as a JSON line to this file")
+@click.option('--daemon', 'use_daemon', is_flag=True, envvar="ASS_DAEMON",
+              help="Log in through a background headless browser kept warm between runs")
+@click.option('--login-engine', envvar="ASS_LOGIN_ENGINE", type=click.Choice(["auto", "http", "browser"]), default="auto",
+              help="Fill in identity provider forms over HTTP without browser, or always use the browser "
+                   "(default: auto, HTTP when the identity provider allows it)")
+@click.option('--serve-credentials', is_flag=True,
+              help="Serve credentials of the selected role to local SDK clients over HTTP instead of writing them, "
+                   "renewing them before they expire")
+@click.option('--serve-port', envvar="ASS_SERVE_PORT", type=int, default=0,
+              help="Local port of --serve-credentials (default: any free port)")
+@click.version_option(version=__version__)
+
+def main(log_level,
+         endpoint_url,
+         show_browser,
+         use_browser,
+         idp_nickname,
+         idp_nicknames,
+         use_stored,
+         role_selection,
+         role_arn,
+         roles,
+         chain_roles,
+         chain_accounts,
+         max_workers,
+         max_logins,
+         clean,
+         no_cache,
+         credential_process,
+         expiry_margin,
+         offline,
+         show_timings,
+         timings_file,
+         use_daemon,
+         login_engine,
+         serve_credentials,
+         serve_port):
+
+    if click.get_current_context().invoked_subcommand is not None:
+        # status does not log in, exec logs in itself with the options given here
+        return
+
+    if clean:
+        print("⚠️ Folder ~/.awscli_saml_sso will be renamed to ~/.awscli_saml_sso.OLD")
+        if input("❓ Proceed (y/n) ?")=="y":
+            CustomConfigParser.clean()
+            sys.exit(0)
+
+    if serve_credentials and (roles is not None or idp_nicknames is not None or chain_roles is not None
+                              or credential_process):
+        raise click.UsageError("--serve-credentials serves a single role, it can't be used with --roles, "
+                               "--idp-nicknames, --chain-roles or --credential-process")
+
+    if chain_roles is not None and (roles is not None or idp_nicknames is not None or credential_process):
+        raise click.UsageError("--chain-roles chains from a single role, it can't be used with --roles, "
+                               "--idp-nicknames or --credential-process")
+
+    if show_timings or timings_file is not None:
+        timings.annotate(version=__version__, idp_nickname=idp_nickname,
+                         mode="credential_process" if credential_process else "idps" if idp_nicknames
+                         else "roles" if roles else "interactive")
+        click.get_current_context().call_on_close(
+            lambda: report_timings(show_timings, timings_file, sys.stderr if credential_process else sys.stdout))
+
+    if credential_process:
+        if idp_nickname is None or role_arn is None:
+            raise click.UsageError("--credential-process requires --idp-nickname and --role-arn")
+        # stdout is reserved to the JSON document read by the AWS CLI
+        credentials = cached_role_credentials(idp_nickname, role_arn, role_selection, no_cache, expiry_margin,
+                                              endpoint_url, log_level,
+                                              login_options=dict(show_browser=show_browser,
+                                                                 use_browser=use_browser,
+                                                                 use_stored=use_stored,
+                                                                 offline=offline,
+                                                                 use_daemon=use_daemon,
+                                                                 login_engine=login_engine))
+        print(json.dumps(credential_process_output(credentials)))
+        return
+
+    configure_logging(log_level)
+
+    if idp_nicknames is not None:
+        if idp_nickname is not None or role_arn is not None or role_selection >= 0:
+            raise click.UsageError("--idp-nicknames can't be used with --idp-nickname, --role-arn or --role-selection")
+        login_all(idp_nicknames, roles or "all", endpoint_url, max_workers, max_logins,
+                  login_options=dict(show_browser=show_browser,
+                                     use_browser=use_browser,
+                                     use_stored=use_stored,
+                                     use_cache=not no_cache,
+                                     offline=offline,
+                                     use_daemon=use_daemon,
+                                     login_engine=login_engine))
+        return
+
+    assertion, idp_nickname = get_assertion(show_browser=show_browser,
+                                            use_browser=use_browser,
+                                            idp_nickname=idp_nickname,
+                                            use_stored=use_stored,
+                                            use_cache=not no_cache,
+                                            offline=offline,
+                                            use_daemon=use_daemon,
+                                            login_engine=login_engine)
+
+    if roles is not None:
+        assume_roles(idp_nickname, get_aws_roles(assertion), roles, assertion, endpoint_url, max_workers)
+        return
+
+    selectedroleindex, role_arn, principal_arn = select_role(get_aws_roles(assertion), role_selection, role_arn)
+
+    credentials = assume_role_with_saml(idp_nickname, role_arn, principal_arn, assertion, endpoint_url)
+
+    if chain_roles is not None:
+        assume_chained(idp_nickname, role_arn, credentials, chain_roles, chain_accounts, endpoint_url, max_workers)
+        return
+
+    if serve_credentials:
+        def refresh():
+            # headless and without prompt when the identity provider session of the browser profile is still valid
+            assertion, _ = get_assertion(show_browser=False,
+                                         use_browser=False,
+                                         idp_nickname=idp_nickname,
+                                         use_stored=True,
+                                         use_cache=True,
+                                         offline=offline,
+                                         use_daemon=use_daemon,
+                                         login_engine=login_engine)
+            return assume_role_with_saml(idp_nickname, role_arn, principal_arn, assertion, endpoint_url)
+        serve(role_arn, credentials, refresh, serve_port, expiry_margin)
+        return
+
+    # Write the AWS STS token into the AWS credential file under the saml profile
+    with timer("credentials write"):
+        write_profiles({"saml": credentials})
+        record_profiles({"saml": profile_entry(idp_nickname, role_arn, credentials)})
 
     # Give the user some basic info as to what has just happened
     print("\n----------------------------------------------------------------")
     print("Your new access key pair has been stored in the AWS configuration file {0} under the saml profile.".format(
-        aws_credentials_path))
-    print("Note that it will expire at {0}.".format(sts_response["Credentials"]["Expiration"]))
+        AWS_CREDENTIALS_FILE))
+    print("Note that it will expire at {0}.".format(credentials["Expiration"]))
     print("After this time, you may safely rerun this script to refresh your access key pair.")
     print(
         "To use this credential, call the AWS CLI with the --profile option (e.g. aws --profile saml ec2 describe-instances).")
     print("----------------------------------------------------------------\n")
 
     # Use the AWS STS token to get caller identity
+    import boto3
     s3 = boto3.client("sts",
-                      aws_access_key_id=sts_response["Credentials"]["AccessKeyId"],
-                      aws_secret_access_key=sts_response["Credentials"]["SecretAccessKey"],
-                      aws_session_token=sts_response["Credentials"]["SessionToken"],
+                      aws_access_key_id=credentials["AccessKeyId"],
+                      aws_secret_access_key=credentials["SecretAccessKey"],
+                      aws_session_token=credentials["SessionToken"],
                       endpoint_url=endpoint_url)
-    response = s3.get_caller_identity()
+    with timer("sts caller identity"):
+        response = s3.get_caller_identity()
     print(f"UserId = {response['UserId']}")
     print(f"Arn = {response['Arn']}")
     print("----------------------------------------------------------------\n")
@@ -189,5 +519,87 @@ def main(log_level,
         print(next_time)
 
 
+
+@main.command()
+@click.argument("profiles", nargs=-1)
+def status(profiles):
+    """Show how long credentials of profiles written by awscli_saml_sso remain valid.
+
+    Answers from the profile index of ~/.awscli_saml_sso only, without network access. Given PROFILES, exits with 1 when
+    one of them is unknown or expired.
+    """
+    index = read_profiles(list(profiles) if len(profiles) > 0 else None)
+    names = profiles or sorted(index)
+    if len(names) == 0:
+        print("No profile written yet")
+        return
+    width = max(len(name) for name in names)
+    valid = True
+    for name in names:
+        if name not in index:
+            print(f"{name:<{width}}  {'unknown':>8}")
+            valid = False
+            continue
+        entry = index[name]
+        seconds = remaining_seconds(entry)
+        valid = valid and seconds > 0
+        print(f"{name:<{width}}  {format_remaining(seconds):>8}  {entry['role_arn']} ({entry['idp_nickname']})")
+    if len(profiles) > 0 and not valid:
+        sys.exit(1)
+
+
+@main.command(name="exec", context_settings={"ignore_unknown_options": True, "allow_interspersed_args": False})
+@click.argument("command", nargs=-1, required=True, type=click.UNPROCESSED)
+@click.pass_context
+def exec_command(ctx, command):
+    """Run COMMAND with credentials of --role-arn in its environment, nothing is written to the AWS credentials file.
+
+    Credentials come from the local cache, the login only runs when they expire within --expiry-margin seconds.
+    Requires --idp-nickname and --role-arn, given before exec:
+
+    \b
+    awscli_saml_sso --use-stored --idp-nickname=MyTenant --role-arn=arn:aws:iam::000000000000:role/Role.Admin exec -- aws s3 ls
+    """
+    options = ctx.parent.params
+    if options["idp_nickname"] is None or options["role_arn"] is None:
+        raise click.UsageError("exec requires --idp-nickname and --role-arn")
+    if any(options[option] for option in ("roles", "idp_nicknames", "chain_roles", "serve_credentials",
+                                          "credential_process")):
+        raise click.UsageError("exec runs a command with a single role, it can't be used with --roles, "
+                               "--idp-nicknames, --chain-roles, --serve-credentials or --credential-process")
+    if options["show_timings"] or options["timings_file"] is not None:
+        timings.annotate(version=__version__, idp_nickname=options["idp_nickname"], mode="exec")
+    credentials = cached_role_credentials(options["idp_nickname"], options["role_arn"], options["role_selection"],
+                                          options["no_cache"], options["expiry_margin"], options["endpoint_url"],
+                                          options["log_level"],
+                                          login_options=dict(show_browser=options["show_browser"],
+                                                             use_browser=options["use_browser"],
+                                                             use_stored=options["use_stored"],
+                                                             offline=options["offline"],
+                                                             use_daemon=options["use_daemon"],
+                                                             login_engine=options["login_engine"]))
+    expiration = credentials["Expiration"]
+    environment = dict(os.environ,
+                       AWS_ACCESS_KEY_ID=credentials["AccessKeyId"],
+                       AWS_SECRET_ACCESS_KEY=credentials["SecretAccessKey"],
+                       AWS_SESSION_TOKEN=credentials["SessionToken"],
+                       # as in the AWS credentials file, for tools still reading the legacy name
+                       AWS_SECURITY_TOKEN=credentials["SessionToken"],
+                       AWS_CREDENTIAL_EXPIRATION=expiration if isinstance(expiration, str) else expiration.isoformat())
+    # stdout and stderr belong to the command from now on, timings are reported before
+    report_timings(options["show_timings"], options["timings_file"], sys.stderr)
+    try:
+        if os.name == "nt":
+            import subprocess
+            sys.exit(subprocess.call(list(command), env=environment))
+        os.execvpe(command[0], command, environment)
+    except FileNotFoundError:
+        print(f"❌ Command not found: {command[0]}", file=sys.stderr)
+        sys.exit(127)
+    except PermissionError:
+        print(f"❌ Command can't be run: {command[0]}", file=sys.stderr)
+        sys.exit(126)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,171 @@
+from hashlib import md5
+from time import monotonic, sleep
+
+from selenium.common.exceptions import NoSuchWindowException, TimeoutException, WebDriverException
+
+from awscli_saml_sso.cache import read_json_file, write_json_file
+from awscli_saml_sso.config_parser import CONFIG_FOLDER
+
+# LEARNED_FLOWS_FOLDER: Sequence of states observed during the last login of each identity provider
+LEARNED_FLOWS_FOLDER = CONFIG_FOLDER / "flows"
+
+# microsoft_flow: Pages of Microsoft Entra login as a state machine.
+# states: how each page is recognized, by the first element matching a CSS selector, optionally narrowed to
+# elements whose text or value is one of texts, whose attribute has a given value or that are visible, or by the
+# current url.
+# {login} and {awsdomain} are replaced at run time.
+# transitions: states expected after acting on a state, in detection order, and the timings phase of the wait.
+# errors: states ending the login, with the prefix of the saved page and the message shown.
+microsoft_flow = {
+    "states": {
+        "aws": {"url": "{awsdomain}"},
+        # Entra keeps hidden copies of inputs on other pages, and slides pages in: states acted on must be visible
+        "login": {"selector": "input[name='loginfmt']", "visible": True},
+        "known_account": {"selector": "div[data-test-id]", "attribute": ["data-test-id", "{login}"], "visible": True},
+        "password": {"selector": "input[type='password'][tabindex='0']", "visible": True},
+        "sign_in": {"selector": "input[type='submit']", "texts": ["Sign in", "Se connecter"], "visible": True},
+        "otc": {"selector": "input[name='otc']", "visible": True},
+        "otc_error": {"selector": "#idSpan_SAOTCC_Error_OTC"},
+        "number_matching": {"selector": "#idRichContext_DisplaySign, #idRemoteNGC_DisplaySign"},
+        "password_error": {"selector": "#passwordError"},
+        "username_error": {"selector": "#usernameError"},
+        "request_denied": {"selector": "#idDiv_SAASDS_Title"},
+        "stay_signed_in": {"selector": "input[type='submit'], input[type='button']", "texts": ["No", "Non"],
+                           "visible": True},
+        "not_now": {"selector": "a", "texts": ["Not now", "Plus tard"], "visible": True},
+    },
+    "transitions": {
+        # login screen is skipped when the identity provider session remembers the account
+        "start": (["aws", "login", "known_account", "password", "otc", "number_matching"], "idp page load"),
+        "login": (["aws", "username_error", "password_error", "password", "otc", "number_matching",
+                   "request_denied", "stay_signed_in", "not_now"], "idp response wait"),
+        "known_account": (["aws", "username_error", "password_error", "password", "otc", "number_matching",
+                           "request_denied", "stay_signed_in", "not_now"], "idp response wait"),
+        "password": (["aws", "password_error", "otc", "number_matching",
+                      "request_denied", "stay_signed_in", "not_now"], "idp response wait"),
+        "otc": (["aws", "otc_error", "request_denied", "stay_signed_in", "not_now"], "mfa wait"),
+        "number_matching": (["aws", "request_denied", "stay_signed_in", "not_now"], "mfa wait"),
+        "stay_signed_in": (["aws", "request_denied", "not_now"], "after mfa"),
+        "not_now": (["aws", "request_denied", "stay_signed_in"], "after mfa"),
+    },
+    "errors": {
+        "password_error": ("error_incorrect_passwd", "❌ Your password is incorrect, "),
+        "username_error": ("error_unknown_email", "❌ Your email is not known for the identity provider, "),
+        "otc_error": ("error_wrong_code", "❌ Your MFA code is wrong, "),
+        "request_denied": ("error_request_denied", "❌ Request was denied, could be unsuccessfull MFA, "),
+    },
+}
+
+# detect_script: Resolves with the first expected state found in the page, checked right away then
+# on every DOM mutation, or with null after the given milliseconds. Given a snippet length, the page url and
+# the start of the form the state was found in (empty outside of a form) come along for the flight recorder,
+# without scripts, styles, nor values of hidden and password inputs (tokens, SAML responses, passwords)
+detect_script = """
+var states = arguments[0], timeout = arguments[1], snippetLength = arguments[2], done = arguments[arguments.length - 1];
+function result(state, element) {
+    if (!snippetLength) { return [state.name, element]; }
+    var form = element && element.closest("form");
+    var snippet = "";
+    if (form) {
+        var copy = form.cloneNode(true);
+        copy.querySelectorAll("script, style, svg").forEach(function(node) { node.remove(); });
+        copy.querySelectorAll("input[type=hidden], input[type=password]").forEach(function(input) {
+            input.removeAttribute("value");
+        });
+        snippet = copy.outerHTML.slice(0, snippetLength);
+    }
+    return [state.name, element, location.href, snippet];
+}
+function detect() {
+    for (var i = 0; i < states.length; i++) {
+        var state = states[i];
+        if (state.url) {
+            if (location.href.indexOf(state.url) >= 0) { return result(state, null); }
+            continue;
+        }
+        var elements = document.querySelectorAll(state.selector);
+        for (var j = 0; j < elements.length; j++) {
+            var element = elements[j];
+            if (state.texts && state.texts.indexOf((element.value || element.textContent || "").trim()) < 0) { continue; }
+            if (state.attribute && element.getAttribute(state.attribute[0]) !== state.attribute[1]) { continue; }
+            if (state.visible && !(element.offsetWidth || element.offsetHeight || element.getClientRects().length)) { continue; }
+            return result(state, element);
+        }
+    }
+    return null;
+}
+var found = detect();
+if (found) { done(found); return; }
+var timer = null;
+var observer = new MutationObserver(function() {
+    var found = detect();
+    if (found) { observer.disconnect(); clearTimeout(timer); done(found); }
+});
+observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+timer = setTimeout(function() { observer.disconnect(); done(null); }, timeout);
+"""
+
+
+def expected_states(flow: dict, names: list, context: dict):
+    states = []
+    for name in names:
+        state = {"name": name}
+        for key, value in flow["states"][name].items():
+            if isinstance(value, str):
+                state[key] = value.format(**context)
+            elif isinstance(value, list):
+                state[key] = [item.format(**context) for item in value]
+            else:
+                state[key] = value
+        states.append(state)
+    return states
+
+
+def wait_for_state(browser, flow: dict, names: list, timeout: float, context: dict, recorder=None):
+    # one script call per page: it returns as soon as a mutation makes one of the states appear,
+    # a navigation interrupts it and detection starts again on the new page.
+    # The state found is added to recorder (flight_recorder.FlightRecorder) when given
+    snippet_length = recorder.snippet_length if recorder is not None else 0
+    states = expected_states(flow, names, context)
+    deadline = monotonic() + timeout
+    while True:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise TimeoutException(f"None of {', '.join(names)} within {timeout} seconds")
+        browser.set_script_timeout(remaining + 5)
+        try:
+            found = browser.execute_async_script(detect_script, states, int(remaining * 1000), snippet_length)
+        except NoSuchWindowException:
+            raise
+        except WebDriverException:
+            # document unloaded while waiting, or not ready yet
+            sleep(0.05)
+            continue
+        if found is not None:
+            if snippet_length > 0:
+                recorder.record(found[0], found[2], found[3])
+            return found[0], found[1]
+
+
+def learned_flow_file(idp_nickname: str):
+    return LEARNED_FLOWS_FOLDER / f"{md5(idp_nickname.encode('utf8')).hexdigest()}.json"
+
+
+def load_learned_flow(idp_nickname: str):
+    # names of the states in the order they showed up, empty before a first login
+    return read_json_file(learned_flow_file(idp_nickname)) or []
+
+
+def store_learned_flow(idp_nickname: str, observed: list):
+    write_json_file(learned_flow_file(idp_nickname), observed)
+
+
+def wait_for_next_state(browser, flow: dict, names: list, timeout: float, context: dict, learned: str = None,
+                        recorder=None):
+    # every expected state is looked for at once, the detection script costs the same whatever their number.
+    # The state seen at this step of the last login comes right after AWS and error states, so that it wins
+    # over other states showing up on the same page
+    if learned is not None and learned in names and learned != "aws" and learned not in flow["errors"]:
+        first = [name for name in names if name == "aws" or name in flow["errors"]]
+        names = first + [learned] + [name for name in names if name not in first and name != learned]
+    return wait_for_state(browser, flow, names, timeout, context, recorder)
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+
+from awscli_saml_sso import storage
+from awscli_saml_sso.aws_credentials import locked
+from awscli_saml_sso.cache import read_json_file, write_json_file
+from awscli_saml_sso.config_parser import CONFIG_FOLDER
+
+# PROFILE_INDEX_FILE: Profiles written to the AWS credentials file, with the role, identity provider and expiration
+# of their credentials, read by the status command without parsing the credentials file nor calling AWS.
+# Kept in the profiles table of the database instead with the sqlite storage backend
+PROFILE_INDEX_FILE = storage.PROFILE_INDEX_FILE
+
+
+def record_profiles(entries: dict):
+    # entries maps a profile name to {"role_arn", "idp_nickname", "expiration"}, merged with the entries
+    # recorded by other runs
+    if storage.storage_backend == "sqlite":
+        return storage.record_profile_rows(entries)
+    CONFIG_FOLDER.mkdir(exist_ok=True)
+    with locked(PROFILE_INDEX_FILE):
+        index = read_json_file(PROFILE_INDEX_FILE) or {}
+        index.update(entries)
+        write_json_file(PROFILE_INDEX_FILE, index)
+
+
+def read_profiles(profiles: list = None):
+    # entries of every profile, or of the given ones when they are recorded
+    if storage.storage_backend == "sqlite":
+        return storage.read_profile_rows(profiles)
+    index = read_json_file(PROFILE_INDEX_FILE) or {}
+    if profiles is not None:
+        return {profile: index[profile] for profile in profiles if profile in index}
+    return index
+
+
+def profile_entry(idp_nickname: str, role_arn: str, credentials: dict):
+    expiration = credentials["Expiration"]
+    return {
+        "role_arn": role_arn,
+        "idp_nickname": idp_nickname,
+        "expiration": expiration if isinstance(expiration, str) else expiration.isoformat(),
+    }
+
+
+def remaining_seconds(entry: dict, now: datetime = None):
+    now = now or datetime.now(timezone.utc)
+    return (datetime.fromisoformat(entry["expiration"]) - now).total_seconds()
+
+
+def format_remaining(seconds: float):
+    if seconds <= 0:
+        return "expired"
+    hours, minutes = divmod(int(seconds) // 60, 60)
+    return f"{hours}h{minutes:02d}m" if hours > 0 else f"{minutes}m{int(seconds) % 60:02d}s"
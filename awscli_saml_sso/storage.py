@@ -0,0 +1,227 @@
+import configparser
+import os
+import threading
+from os import environ
+
+from awscli_saml_sso.aws_credentials import locked
+from awscli_saml_sso.cache import read_json_file
+from awscli_saml_sso.config_parser import CONFIG_FOLDER
+
+# storage_backend: Where identity provider settings and the profile index are kept. "ini" is the historical
+# ~/.awscli_saml_sso/credentials file (and profiles.json), read and rewritten in full. "sqlite" is an indexed
+# database in WAL mode that only reads and writes the rows in use, filled from the ini file when created
+storage_backend = environ.get("ASS_STORAGE", "ini")
+
+SETTINGS_FILE = CONFIG_FOLDER / "credentials"
+PROFILE_INDEX_FILE = CONFIG_FOLDER / "profiles.json"
+SETTINGS_DATABASE = CONFIG_FOLDER / "settings.db"
+
+# busy_timeout: Seconds a write waits for another process writing the database
+busy_timeout = 30
+
+schema = """
+CREATE TABLE IF NOT EXISTS idps (
+    position INTEGER PRIMARY KEY,
+    idp_nickname TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS idp_settings (
+    idp_nickname TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (idp_nickname, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS profiles (
+    profile TEXT PRIMARY KEY,
+    role_arn TEXT NOT NULL,
+    idp_nickname TEXT NOT NULL,
+    expiration TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def file_version(file):
+    # path or file descriptor, tells whether a file was replaced or modified since it was read
+    stat = os.stat(file)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class IniSettings():
+    # settings of each identity provider in a section of an ini file, parsed in full when opened
+
+    def __init__(self, path=SETTINGS_FILE):
+        self.path = path
+        self.path.touch(mode=0o600, exist_ok=True)
+        with open(self.path.as_posix(), "r") as fp:
+            self.config = configparser.ConfigParser()
+            self.config.read_file(fp)
+            self.loaded_version = file_version(fp.fileno())
+        # sections changed since the last write, only these are written over the file content
+        self.changed_sections = set()
+
+    def __contains__(self, idp_nickname):
+        return idp_nickname in self.config
+
+    def nicknames(self):
+        return self.config.sections()
+
+    def get(self, idp_nickname, key):
+        if idp_nickname in self.config and key in self.config[idp_nickname]:
+            return self.config[idp_nickname][key]
+        return None
+
+    def set(self, idp_nickname, key, value):
+        if idp_nickname not in self.config:
+            self.config[idp_nickname] = {}
+        self.config[idp_nickname][key] = value
+        self.changed_sections.add(idp_nickname)
+
+    def reset(self, idp_nickname):
+        self.config[idp_nickname] = {}
+        self.changed_sections.add(idp_nickname)
+
+    def commit(self):
+        # runs at the same time (--idp-nicknames, other processes) each write their own sections
+        # over the current file content, which is replaced atomically so that it is never read partially
+        if len(self.changed_sections) == 0:
+            return
+        with locked(self.path):
+            current = self.config
+            if file_version(self.path.as_posix()) != self.loaded_version:
+                # written by someone else since it was read
+                current = configparser.ConfigParser()
+                with open(self.path.as_posix(), "r") as fp:
+                    current.read_file(fp)
+                for section in self.changed_sections:
+                    current[section] = dict(self.config.items(section, raw=True))
+            temporary = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            fd = os.open(temporary.as_posix(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as fp:
+                current.write(fp)
+                fp.flush()
+                self.loaded_version = file_version(fp.fileno())
+            os.replace(temporary.as_posix(), self.path.as_posix())
+        self.config = current
+        self.changed_sections = set()
+
+
+class SqliteSettings():
+    # settings of each identity provider in rows of an indexed database, looked up one at a time.
+    # Changes are kept in memory and written in one short write transaction by commit(), so that
+    # a login lasting minutes never holds the database lock
+
+    def __init__(self, path=SETTINGS_DATABASE):
+        self.connection = connect(path)
+        # idp_nickname -> {"reset": section cleared before values, "values": {key: value}}
+        self.changes = {}
+
+    def __contains__(self, idp_nickname):
+        if idp_nickname in self.changes:
+            return True
+        return self.connection.execute("SELECT 1 FROM idps WHERE idp_nickname = ?", (idp_nickname,)).fetchone() is not None
+
+    def nicknames(self):
+        stored = [row[0] for row in self.connection.execute("SELECT idp_nickname FROM idps ORDER BY position")]
+        return stored + [idp_nickname for idp_nickname in self.changes if idp_nickname not in stored]
+
+    def get(self, idp_nickname, key):
+        change = self.changes.get(idp_nickname)
+        if change is not None:
+            if key in change["values"]:
+                return change["values"][key]
+            if change["reset"]:
+                return None
+        row = self.connection.execute("SELECT value FROM idp_settings WHERE idp_nickname = ? AND key = ?",
+                                      (idp_nickname, key)).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, idp_nickname, key, value):
+        self.changes.setdefault(idp_nickname, {"reset": False, "values": {}})["values"][key] = value
+
+    def reset(self, idp_nickname):
+        self.changes[idp_nickname] = {"reset": True, "values": {}}
+
+    def commit(self):
+        if len(self.changes) == 0:
+            return
+        with self.connection:
+            for idp_nickname, change in self.changes.items():
+                self.connection.execute("INSERT OR IGNORE INTO idps (idp_nickname) VALUES (?)", (idp_nickname,))
+                if change["reset"]:
+                    self.connection.execute("DELETE FROM idp_settings WHERE idp_nickname = ?", (idp_nickname,))
+                self.connection.executemany("INSERT OR REPLACE INTO idp_settings (idp_nickname, key, value) VALUES (?, ?, ?)",
+                                            [(idp_nickname, key, value) for key, value in change["values"].items()])
+        self.changes = {}
+
+
+def open_settings():
+    if storage_backend == "sqlite":
+        return SqliteSettings()
+    return IniSettings()
+
+
+def connect(path=SETTINGS_DATABASE):
+    import sqlite3
+    created = False
+    if not path.exists():
+        # settings are readable by current user only, as the ini file
+        path.parent.mkdir(exist_ok=True)
+        try:
+            os.close(os.open(path.as_posix(), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+            created = True
+        except FileExistsError:
+            pass
+    # a config parser may be built in one thread and used in another one, never by two at once
+    connection = sqlite3.connect(path.as_posix(), timeout=busy_timeout, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(schema)
+    if created:
+        migrate(connection)
+    return connection
+
+
+def migrate(connection, settings_file=SETTINGS_FILE, profile_index_file=PROFILE_INDEX_FILE):
+    # a new database starts with what the ini backend stored, which is left untouched.
+    # Rows already there are kept, in case another process created the database at the same time
+    config = configparser.ConfigParser()
+    if settings_file.exists():
+        with open(settings_file.as_posix(), "r") as fp:
+            config.read_file(fp)
+    with connection:
+        for idp_nickname in config.sections():
+            connection.execute("INSERT OR IGNORE INTO idps (idp_nickname) VALUES (?)", (idp_nickname,))
+            connection.executemany("INSERT OR IGNORE INTO idp_settings (idp_nickname, key, value) VALUES (?, ?, ?)",
+                                   [(idp_nickname, key, value) for key, value in config.items(idp_nickname, raw=True)])
+        index = read_json_file(profile_index_file) or {}
+        connection.executemany("INSERT OR IGNORE INTO profiles (profile, role_arn, idp_nickname, expiration) "
+                               "VALUES (?, ?, ?, ?)",
+                               [(profile, entry["role_arn"], entry["idp_nickname"], entry["expiration"])
+                                for profile, entry in index.items()])
+
+
+def record_profile_rows(entries: dict):
+    connection = connect()
+    try:
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO profiles (profile, role_arn, idp_nickname, expiration) "
+                                   "VALUES (?, ?, ?, ?)",
+                                   [(profile, entry["role_arn"], entry["idp_nickname"], entry["expiration"])
+                                    for profile, entry in entries.items()])
+    finally:
+        connection.close()
+
+
+def read_profile_rows(profiles: list = None):
+    # every profile, or only the given ones looked up by primary key
+    connection = connect()
+    try:
+        query = "SELECT profile, role_arn, idp_nickname, expiration FROM profiles"
+        if profiles is not None:
+            rows = [row for profile in profiles
+                    for row in connection.execute(query + " WHERE profile = ?", (profile,))]
+        else:
+            rows = connection.execute(query)
+        return {profile: {"role_arn": role_arn, "idp_nickname": idp_nickname, "expiration": expiration}
+                for profile, role_arn, idp_nickname, expiration in rows}
+    finally:
+        connection.close()
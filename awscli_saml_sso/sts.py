@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os import environ
+
+from awscli_saml_sso.cache import store_credentials
+from awscli_saml_sso.timings import timer
+
+# default_max_workers: Default number of roles assumed concurrently
+default_max_workers = 8
+
+# chain_max_attempts: Attempts of each chained AssumeRole call, throttled calls are retried
+# with exponential backoff and jitter (botocore standard retry mode)
+chain_max_attempts = int(environ.get("ASS_CHAIN_MAX_ATTEMPTS", 8))
+
+# chain_session_name: RoleSessionName of chained role sessions, shown in CloudTrail of member accounts
+chain_session_name = environ.get("ASS_CHAIN_SESSION_NAME", "awscli_saml_sso")
+
+
+def assume_role_with_saml(idp_nickname, role_arn, principal_arn, assertion, endpoint_url, client=None):
+    # Use the assertion to get an AWS STS token using Assume Role with SAML
+    if client is None:
+        import boto3
+        client = boto3.client("sts", endpoint_url=endpoint_url)
+    with timer("sts assume role"):
+        sts_response = client.assume_role_with_saml(RoleArn=role_arn, PrincipalArn=principal_arn, SAMLAssertion=assertion)
+    store_credentials(idp_nickname, role_arn, sts_response["Credentials"])
+    return sts_response["Credentials"]
+
+
+def fan_out(function, calls, max_workers):
+    # calls maps a key to the arguments of function, returns results by key and errors by key
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(function, *arguments): key for key, arguments in calls.items()}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+    return results, errors
+
+
+def assume_roles_with_saml(idp_nickname, awsroles, assertion, endpoint_url, max_workers=default_max_workers):
+    # awsroles are AwsRole records, returns credentials by role_arn and errors by role_arn
+    # a single client is shared by all threads, its connection pool is sized to the number of workers
+    import boto3
+    from botocore.config import Config
+    session = boto3.session.Session()
+    client = session.client("sts", endpoint_url=endpoint_url, config=Config(max_pool_connections=max_workers))
+    return fan_out(assume_role_with_saml,
+                   {awsrole.role_arn: (idp_nickname, awsrole.role_arn, awsrole.principal_arn, assertion, endpoint_url,
+                                       client)
+                    for awsrole in awsroles},
+                   max_workers)
+
+
+def assume_chained_role(client, role_arn):
+    with timer("sts assume chained role"):
+        sts_response = client.assume_role(RoleArn=role_arn, RoleSessionName=chain_session_name)
+    return sts_response["Credentials"]
+
+
+def assume_chained_roles(credentials, role_arns, endpoint_url, max_workers=default_max_workers):
+    # role_arns are assumed from the session of credentials (hub role obtained with SAML),
+    # returns credentials by role_arn and errors by role_arn
+    import boto3
+    from botocore.config import Config
+    session = boto3.session.Session(aws_access_key_id=credentials["AccessKeyId"],
+                                    aws_secret_access_key=credentials["SecretAccessKey"],
+                                    aws_session_token=credentials["SessionToken"])
+    client = session.client("sts", endpoint_url=endpoint_url,
+                            config=Config(max_pool_connections=max_workers,
+                                          retries={"mode": "standard", "max_attempts": chain_max_attempts}))
+    return fan_out(assume_chained_role, {role_arn: (client, role_arn) for role_arn in role_arns}, max_workers)
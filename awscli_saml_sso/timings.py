@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# started_at: Reference point of the current run, phase offsets are relative to it
+started_at = time.perf_counter()
+
+# recorded_phases: (phase, offset, duration) in seconds, in completion order
+recorded_phases = []
+
+# annotations: Context of the current run added to the JSON lines record (idp nickname, mode, ...)
+annotations = {}
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def timer(phase: str):
+    # cheap enough to stay enabled: two perf_counter calls and a list append per phase
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        with _lock:
+            recorded_phases.append((phase, start - started_at, end - start))
+
+
+def annotate(**kwargs):
+    annotations.update(kwargs)
+
+
+def summary():
+    # phases recorded several times (retries, concurrent STS calls) count the time during which
+    # at least one of them was running, so that concurrent calls are not summed up
+    intervals = {}
+    for phase, offset, duration in recorded_phases:
+        intervals.setdefault(phase, []).append((offset, offset + duration))
+    phases = {}
+    for phase, phase_intervals in intervals.items():
+        elapsed, current_start, current_end = 0.0, None, None
+        for start, end in sorted(phase_intervals):
+            if current_end is None or start > current_end:
+                if current_end is not None:
+                    elapsed += current_end - current_start
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        elapsed += current_end - current_start
+        phases[phase] = (len(phase_intervals), elapsed)
+    return phases
+
+
+def print_report(file=sys.stdout):
+    total = time.perf_counter() - started_at
+    print("\n⏱️ Timings", file=file)
+    print(f"{'phase':<24} {'count':>5} {'seconds':>9} {'share':>7}", file=file)
+    for phase, (count, duration) in summary().items():
+        print(f"{phase:<24} {count:>5} {duration:>9.3f} {duration / total:>7.1%}", file=file)
+    print(f"{'total':<24} {'':>5} {total:>9.3f} {1:>7.1%}", file=file)
+
+
+def write_record(timings_file: str):
+    # one JSON document per line so that files from many hosts can simply be concatenated
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "total": round(time.perf_counter() - started_at, 3),
+        "phases": {phase: round(duration, 3) for phase, (_, duration) in summary().items()},
+    }
+    record.update(annotations)
+    with open(os.path.expanduser(timings_file), "a") as fp:
+        fp.write(json.dumps(record) + "\n")
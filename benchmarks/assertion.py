@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Micro-benchmark of role extraction on synthetic assertions carrying thousands of roles:
+#   python benchmarks/assertion.py [--roles 100 1000 5000 20000] [--runs 5]
+# Half of the role values are written principal_arn,role_arn as some identity providers do,
+# which is the case the former in place reversal handled in quadratic time.
+import argparse
+import base64
+import statistics
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+from awscli_saml_sso.assertion import parse_assertion
+
+
+def make_assertion(role_count):
+    role_values = []
+    for i in range(role_count):
+        role_arn = f"arn:aws:iam::{i:012d}:role/Role.{i}"
+        principal_arn = f"arn:aws:iam::{i:012d}:saml-provider/SamlExampleProvider"
+        pair = (principal_arn, role_arn) if i % 2 else (role_arn, principal_arn)
+        role_values.append(f"<saml2:AttributeValue>{','.join(pair)}</saml2:AttributeValue>")
+    saml_response = (
+        '<saml2p:Response xmlns:saml2p="urn:oasis:names:tc:SAML:2.0:protocol" '
+        'xmlns:saml2="urn:oasis:names:tc:SAML:2.0:assertion"><saml2:Assertion>'
+        '<saml2:Conditions NotBefore="2020-12-06T10:43:54.880Z" NotOnOrAfter="2020-12-06T10:44:54.880Z"/>'
+        '<saml2:AttributeStatement>'
+        f'<saml2:Attribute Name="https://aws.amazon.com/SAML/Attributes/Role">{"".join(role_values)}</saml2:Attribute>'
+        '</saml2:AttributeStatement></saml2:Assertion></saml2p:Response>'
+    )
+    return base64.b64encode(saml_response.encode("utf8")).decode("ascii")
+
+
+def legacy_get_aws_roles(assertion):
+    # role extraction as done in main.py up to 0.3.2, kept here as the reference
+    awsroles = []
+    root = ET.fromstring(base64.b64decode(assertion))
+    for saml2attribute in root.iter("{urn:oasis:names:tc:SAML:2.0:assertion}Attribute"):
+        if (saml2attribute.get("Name") == "https://aws.amazon.com/SAML/Attributes/Role"):
+            for saml2attributevalue in saml2attribute.iter("{urn:oasis:names:tc:SAML:2.0:assertion}AttributeValue"):
+                awsroles.append(saml2attributevalue.text)
+    for awsrole in awsroles:
+        chunks = awsrole.split(",")
+        if "saml-provider" in chunks[0]:
+            newawsrole = chunks[1] + "," + chunks[0]
+            index = awsroles.index(awsrole)
+            awsroles.insert(index, newawsrole)
+            awsroles.remove(awsrole)
+    return awsroles
+
+
+def measure(function, assertion, runs):
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(assertion)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure SAML role extraction on synthetic assertions")
+    parser.add_argument("--roles", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'roles':>7} {'parser':<8} {'median ms':>10} {'min ms':>10}")
+    for role_count in args.roles:
+        assertion = make_assertion(role_count)
+        assert len(parse_assertion(assertion).roles) == role_count
+        for name, function in [("legacy", legacy_get_aws_roles), ("stream", parse_assertion)]:
+            median, minimum = measure(function, assertion, args.runs)
+            print(f"{role_count:>7} {name:<8} {median * 1000:>10.2f} {minimum * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
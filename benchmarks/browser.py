@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Headless browser start up time and memory for each launch profile and profile mode, Linux only:
+#   python benchmarks/browser.py [--browser Edge] [--runs 5] [--grow-runs 3] [--profile PATH]
+# The measured profile is a copy of --profile (an existing ~/.awscli_saml_sso/profile/<browser>/<hash>)
+# or a profile grown by --grow-runs full launches loading the login page of fake_idp.py.
+# Start up is start_browser(), memory is summed over the browser process tree once the login page is loaded:
+# RSS counts shared pages once per process, PSS splits them between processes.
+# Requires the selected browser to be installed, drivers are resolved as usual.
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+sys.path.insert(0, Path(__file__).resolve().parent.as_posix())
+
+from fake_idp import FakeIdentityProvider
+
+role_arn = "arn:aws:iam::000000000000:role/Role.Admin"
+principal_arn = "arn:aws:iam::000000000000:saml-provider/SamlExampleProvider"
+
+# (launch profile, profile mode), the first one is the default
+configurations = [
+    ("full", "persistent"),
+    ("lean", "persistent"),
+    ("lean", "pruned"),
+    ("lean", "snapshot"),
+]
+
+
+def process_tree(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as fp:
+                    parent = int(fp.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        process = pending.pop()
+        tree.append(process)
+        pending.extend(children.get(process, []))
+    return tree
+
+
+def memory(pid):
+    # bytes of RSS and PSS of pid and its descendants
+    rss, pss = 0, 0
+    for process in process_tree(pid):
+        try:
+            with open(f"/proc/{process}/smaps_rollup") as fp:
+                for line in fp:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1]) * 1024
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return rss, pss
+
+
+def folder_size(folder):
+    return sum(path.stat().st_size for path in Path(folder).rglob("*") if path.is_file())
+
+
+def grow_profile(user_data_dir, browser_kind, page_url, runs):
+    from awscli_saml_sso import browser, browser_profile
+    browser.launch_profile, browser_profile.profile_mode = "full", "persistent"
+    for _ in range(runs):
+        started = browser.start_browser(show_browser=False, browser_kind=browser_kind,
+                                        user_data_dir=user_data_dir, quiet=True)
+        started.get(page_url)
+        # leaves time to background networking and component updates, as a real login does
+        time.sleep(5)
+        browser.quit_browser(started)
+
+
+def measure(user_data_dir, browser_kind, page_url, launch_profile, profile_mode, runs):
+    from awscli_saml_sso import browser, browser_profile
+    browser.launch_profile, browser_profile.profile_mode = launch_profile, profile_mode
+    startups, page_loads, quits, rss, pss = [], [], [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        started = browser.start_browser(show_browser=False, browser_kind=browser_kind,
+                                        user_data_dir=user_data_dir, quiet=True)
+        launched = time.perf_counter()
+        started.get(page_url)
+        page_loads.append(time.perf_counter() - launched)
+        startups.append(launched - start)
+        run_rss, run_pss = memory(started.service.process.pid)
+        rss.append(run_rss)
+        pss.append(run_pss)
+        start = time.perf_counter()
+        browser.quit_browser(started)
+        quits.append(time.perf_counter() - start)
+    return startups, page_loads, quits, rss, pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure headless browser start up time and memory")
+    parser.add_argument("--browser", choices=["Edge", "Chrome"], default="Edge")
+    parser.add_argument("--runs", type=int, default=5, help="Launches measured for each configuration")
+    parser.add_argument("--grow-runs", type=int, default=3, help="Full launches growing the profile when no --profile")
+    parser.add_argument("--profile", help="Existing browser profile folder, copied before being measured")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home, FakeIdentityProvider([role_arn], principal_arn) as fake_idp:
+        # environment is read at import time by awscli_saml_sso modules
+        os.environ["HOME"] = home
+        os.environ["ASS_AWS_SAML_HOMEPAGE"] = fake_idp.saml_homepage
+        os.environ["ASS_BROWSER_ARGUMENTS"] = "--proxy-bypass-list=<-loopback>"
+        from awscli_saml_sso.browser import SupportedBrowsers
+        browser_kind = [bk for bk in SupportedBrowsers if bk.value["name"] == args.browser][0]
+        page_url = fake_idp.url("microsoft")
+
+        grown = Path(home, "grown")
+        if args.profile:
+            shutil.copytree(args.profile, grown.as_posix(), symlinks=True)
+        else:
+            grow_profile(grown.as_posix(), browser_kind, page_url, args.grow_runs)
+        print(f"profile: {folder_size(grown) / 2 ** 20:.1f} MiB\n")
+
+        print(f"{'launch':<6} {'profile':<10} {'startup (s)':>11} {'page (s)':>9} {'quit (s)':>9} "
+              f"{'RSS (MiB)':>10} {'PSS (MiB)':>10} {'profile after (MiB)':>20}   (medians)")
+        for launch_profile, profile_mode in configurations:
+            # every configuration starts from the same grown profile
+            user_data_dir = Path(home, f"{launch_profile}-{profile_mode}")
+            shutil.copytree(grown.as_posix(), user_data_dir.as_posix(), symlinks=True)
+            startups, page_loads, quits, rss, pss = measure(user_data_dir.as_posix(), browser_kind, page_url,
+                                                            launch_profile, profile_mode, args.runs)
+            print(f"{launch_profile:<6} {profile_mode:<10} {statistics.median(startups):>11.3f} "
+                  f"{statistics.median(page_loads):>9.3f} {statistics.median(quits):>9.3f} "
+                  f"{statistics.median(rss) / 2 ** 20:>10.1f} {statistics.median(pss) / 2 ** 20:>10.1f} "
+                  f"{folder_size(user_data_dir) / 2 ** 20:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
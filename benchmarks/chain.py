@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Check of chained role assumption against a mocked STS (moto), with throttling injected on AssumeRole:
+#   python benchmarks/chain.py [--roles 3] [--accounts 100] [--throttling 0.3] [--max-workers 16]
+# --roles role names are expanded for each of --accounts account ids (one of them listed twice) as --chain-roles
+# and --chain-accounts do, then assumed from a hub role session while a share of AssumeRole calls is answered
+# with a Throttling error. Every distinct role must be assumed (throttled calls retried), written once to the
+# AWS credentials file under its own profile name next to the saml profile, and recorded in the profile index.
+import argparse
+import configparser
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+# AWS credentials file and config folder are read from home at import time
+os.environ["HOME"] = tempfile.mkdtemp(prefix="awscli_saml_sso_benchmark_")
+os.environ.update(AWS_DEFAULT_REGION="us-east-1", AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing")
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from moto import mock_sts
+
+from awscli_saml_sso.aws_credentials import AWS_CREDENTIALS_FILE, profile_name
+from awscli_saml_sso.main import assume_chained, chain_role_arns
+from awscli_saml_sso.profile_index import read_profiles
+
+hub_role_arn = "arn:aws:iam::000000000000:role/Hub"
+hub_credentials = {"AccessKeyId": "ASIAHUB", "SecretAccessKey": "secret", "SessionToken": "token",
+                   "Expiration": datetime.now(timezone.utc) + timedelta(hours=1)}
+throttling_body = (b"<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code>"
+                   b"<Message>Rate exceeded</Message></Error></ErrorResponse>")
+
+
+class EmptyStream():
+    def stream(self, **kwargs):
+        yield b""
+
+
+class Throttler():
+    # answers a share of AssumeRole calls of every STS client with a Throttling error before they are sent
+    def __init__(self, share):
+        self.share = share
+        self.calls = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+        self.client = boto3.session.Session.client
+
+    def before_send(self, request, **kwargs):
+        with self.lock:
+            self.calls += 1
+            if random.random() >= self.share:
+                return None
+            self.throttled += 1
+        response = AWSResponse(request.url, 400, {}, EmptyStream())
+        response._content = throttling_body
+        return response
+
+    def __enter__(self):
+        throttler, client = self, self.client
+
+        def throttled_client(session, *args, **kwargs):
+            created = client(session, *args, **kwargs)
+            created.meta.events.register_first("before-send.sts.AssumeRole", throttler.before_send)
+            return created
+
+        boto3.session.Session.client = throttled_client
+        return self
+
+    def __exit__(self, *exc_info):
+        boto3.session.Session.client = self.client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check chained role profiles and throttling retries")
+    parser.add_argument("--roles", type=int, default=3, help="Role names assumed in each account")
+    parser.add_argument("--accounts", type=int, default=100, help="Member accounts")
+    parser.add_argument("--throttling", type=float, default=0.3, help="Share of AssumeRole calls throttled")
+    parser.add_argument("--max-workers", type=int, default=16)
+    args = parser.parse_args()
+
+    accounts = [f"{100000000000 + i:012d}" for i in range(args.accounts)]
+    chain_roles = ",".join(f"arn:aws:iam::{{account_id}}:role/team/Member{i}" for i in range(args.roles))
+    role_arns = chain_role_arns(chain_roles, ",".join(accounts + accounts[:1]))
+    distinct_arns = set(role_arns)
+    expected = {profile_name(role_arn) for role_arn in distinct_arns} | {"saml"}
+
+    failures = []
+    if len(expected) != len(distinct_arns) + 1:
+        failures.append(f"{len(distinct_arns)} chained roles share {len(expected) - 1} profile names")
+
+    with mock_sts(), Throttler(args.throttling) as throttler:
+        start = time.perf_counter()
+        assume_chained("benchmark", hub_role_arn, hub_credentials, chain_roles, ",".join(accounts + accounts[:1]),
+                       None, args.max_workers)
+        duration = time.perf_counter() - start
+
+    config = configparser.RawConfigParser()
+    config.read(AWS_CREDENTIALS_FILE)
+    written = set(config.sections())
+    recorded = set(read_profiles())
+    if written != expected:
+        failures.append(f"{len(expected - written)} profiles missing and {len(written - expected)} unexpected "
+                        "in the AWS credentials file")
+    if recorded != expected:
+        failures.append(f"{len(expected - recorded)} profiles missing and {len(recorded - expected)} unexpected "
+                        "in the profile index")
+    if len({config.get(profile, "aws_access_key_id") for profile in written - {"saml"}}) != len(written - {"saml"}):
+        failures.append("chained profiles share credentials")
+    if args.throttling > 0 and throttler.throttled == 0:
+        failures.append("no AssumeRole call was throttled, retries were not exercised")
+
+    print(f"\n{len(distinct_arns)} chained roles, {throttler.calls} AssumeRole calls, {throttler.throttled} throttled, "
+          f"{len(written)} profiles written in {duration:.2f}s")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Every chained role has its own profile")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(os.environ["HOME"])
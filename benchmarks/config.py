@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Benchmark of the stored settings of a first login, on a config file holding many identity providers
+# as consultancies with many tenants have:
+#   python benchmarks/config.py [--idps 500] [--logins 20] [--keyring-latency 20]
+# Settings are either written on each change or once in a transaction, and the keyring is read through
+# a backend answering after --keyring-latency milliseconds, as a D-Bus round trip to the Secret Service does.
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+# config folder is read from home at import time
+os.environ["HOME"] = tempfile.mkdtemp(prefix="awscli_saml_sso_benchmark_")
+
+import keyring
+from keyring.backend import KeyringBackend
+
+from awscli_saml_sso import config_parser as config_parser_module
+from awscli_saml_sso import storage
+from awscli_saml_sso.config_parser import CustomConfigParser
+
+
+class SlowKeyring(KeyringBackend):
+    priority = 1
+    latency = 0.02
+
+    def __init__(self):
+        super().__init__()
+        self.passwords = {}
+        self.calls = 0
+
+    def get_password(self, service, username):
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.passwords.get((service, username))
+
+    def set_password(self, service, username, password):
+        time.sleep(self.latency)
+        self.passwords[(service, username)] = password
+
+    def delete_password(self, service, username):
+        self.passwords.pop((service, username), None)
+
+
+def fill_config(idp_count):
+    config_parser = CustomConfigParser()
+    with config_parser.transaction():
+        for i in range(idp_count):
+            idp_nickname = f"tenant{i}"
+            config_parser.store_idp_url(idp_nickname, f"https://login.example.com/{i}/saml2")
+            config_parser.store_login(idp_nickname, f"consultant@tenant{i}.example.com")
+            config_parser.store_browser_details(idp_nickname, "Chrome", f"/tmp/profile/{i}")
+            config_parser.store_login_engine(idp_nickname, "browser")
+
+
+def first_login_settings(idp_nickname, transactional):
+    # what a first login stores: identity provider url, login, browser, login engine
+    config_parser = CustomConfigParser()
+    writes = 0
+    original_commit = config_parser.commit
+
+    def counted_commit():
+        nonlocal writes
+        writes += 1
+        original_commit()
+
+    config_parser.commit = counted_commit
+    start = time.perf_counter()
+    if transactional:
+        with config_parser.transaction():
+            store_first_login_settings(config_parser, idp_nickname)
+    else:
+        store_first_login_settings(config_parser, idp_nickname)
+    return time.perf_counter() - start, writes
+
+
+def store_first_login_settings(config_parser, idp_nickname):
+    config_parser.store_idp_url(idp_nickname, "https://login.example.com/new/saml2")
+    config_parser.store_login(idp_nickname, "consultant@new.example.com")
+    config_parser.store_browser_details(idp_nickname, "Chrome", "/tmp/profile/new")
+    config_parser.store_login_engine(idp_nickname, "browser")
+
+
+def password_lookups(backend, idp_nickname, lookups, memoised):
+    config_parser_module.stored_passwords.clear()
+    backend.calls = 0
+    start = time.perf_counter()
+    for _ in range(lookups):
+        if memoised:
+            config_parser_module.lookup_password(idp_nickname)
+        else:
+            keyring.get_password("idp_nickname", idp_nickname)
+    return time.perf_counter() - start, backend.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure stored settings writes and keyring reads of a login")
+    parser.add_argument("--idps", type=int, default=500, help="Identity providers already in the config file")
+    parser.add_argument("--logins", type=int, default=20, help="First logins measured in each mode")
+    parser.add_argument("--keyring-latency", type=float, default=20, help="Milliseconds of each keyring call")
+    args = parser.parse_args()
+
+    backend = SlowKeyring()
+    SlowKeyring.latency = args.keyring_latency / 1000
+    keyring.set_keyring(backend)
+    fill_config(args.idps)
+    # ASS_STORAGE=sqlite measures the same logins on the database backend
+    settings_file = storage.SETTINGS_DATABASE if storage.storage_backend == "sqlite" else storage.SETTINGS_FILE
+    config_size = settings_file.stat().st_size
+    print(f"{settings_file.name}: {args.idps} identity providers, {config_size / 1024:.0f} KiB")
+
+    for transactional in (False, True):
+        timings, writes = [], 0
+        for i in range(args.logins):
+            elapsed, login_writes = first_login_settings(f"new{transactional}{i}", transactional)
+            timings.append(elapsed)
+            writes += login_writes
+        print(f"{'transaction' if transactional else 'write on each change'}: "
+              f"median {statistics.median(timings) * 1000:.2f} ms per first login, "
+              f"{writes / args.logins:.0f} writes")
+
+    backend.passwords[("idp_nickname", "tenant0")] = "password"
+    for memoised in (False, True):
+        elapsed, calls = password_lookups(backend, "tenant0", 5, memoised)
+        print(f"{'memoised' if memoised else 'direct'} keyring: 5 password reads in {elapsed * 1000:.1f} ms, "
+              f"{calls} backend calls")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(os.environ["HOME"])
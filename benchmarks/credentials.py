@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Stress test of concurrent writes to the AWS credentials file, as done by parallel CI jobs:
+#   python benchmarks/credentials.py [--writers 16] [--profiles 20] [--legacy]
+# Each writer process adds its own profiles one write at a time while the others do the same,
+# then the file is checked to hold every profile. --legacy runs the former unlocked in place writer.
+# The file starts with multi-line values, one in a profile rewritten by a writer, which must not leak into
+# the rewritten value, and one in the default profile, which must be kept.
+import argparse
+import configparser
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+from awscli_saml_sso.aws_credentials import write_profiles
+
+
+def legacy_write_profiles(profiles, aws_credentials_path):
+    # writer used up to 0.3.2, kept here as the reference
+    config = configparser.RawConfigParser()
+    config.read(aws_credentials_path)
+    for profile, credentials in profiles.items():
+        if not config.has_section(profile):
+            config.add_section(profile)
+        config.set(profile, "aws_access_key_id", credentials["AccessKeyId"])
+        config.set(profile, "aws_secret_access_key", credentials["SecretAccessKey"])
+        config.set(profile, "aws_session_token", credentials["SessionToken"])
+        config.set(profile, "aws_security_token", credentials["SessionToken"])
+    with aws_credentials_path.open(mode="w+") as configfile:
+        config.write(configfile)
+
+
+def writer(aws_credentials_path, writer_index, profile_count, legacy, start_event):
+    start_event.wait()
+    write = legacy_write_profiles if legacy else write_profiles
+    for profile_index in range(profile_count):
+        profile = f"writer{writer_index}-profile{profile_index}"
+        credentials = {"AccessKeyId": f"ASIA{writer_index}{profile_index}", "SecretAccessKey": "secret",
+                       "SessionToken": f"token-{profile}"}
+        try:
+            write({profile: credentials}, aws_credentials_path)
+        except configparser.Error:
+            # legacy writer may read a file truncated by another one
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that concurrent writers never lose a profile")
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--profiles", type=int, default=20, help="Profiles written by each writer, one write each")
+    parser.add_argument("--legacy", action="store_true", help="Use the former unlocked in place writer")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        aws_credentials_path = Path(folder) / "credentials"
+        aws_credentials_path.write_text("[default]\naws_access_key_id = AKIA\naws_secret_access_key = secret\n"
+                                        "note = first line\n    second line\n\n"
+                                        "[writer0-profile0]\naws_session_token = stale\n    stale continued\n\n"
+                                        "    stale after a blank line\nregion = eu-west-1\n")
+        start_event = multiprocessing.Event()
+        processes = [multiprocessing.Process(target=writer,
+                                             args=(aws_credentials_path, i, args.profiles, args.legacy, start_event))
+                     for i in range(args.writers)]
+        for process in processes:
+            process.start()
+        start = time.perf_counter()
+        start_event.set()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        config = configparser.RawConfigParser()
+        try:
+            config.read(aws_credentials_path)
+        except configparser.Error as e:
+            print(f"credentials file is not readable anymore: {e}")
+            sys.exit(1)
+        expected = {"default"} | {f"writer{i}-profile{j}" for i in range(args.writers) for j in range(args.profiles)}
+        lost = expected - set(config.sections())
+        corrupted = [profile for profile in expected - lost - {"default"}
+                     if config.get(profile, "aws_session_token", fallback=None) != f"token-{profile}"]
+        if "default" not in lost and config.get("default", "note", fallback=None) != "first line\nsecond line":
+            corrupted.append("default")
+        if "writer0-profile0" not in lost and config.get("writer0-profile0", "region", fallback=None) != "eu-west-1":
+            corrupted.append("writer0-profile0")
+
+    writes = args.writers * args.profiles
+    print(f"{'legacy' if args.legacy else 'locked'} writer: {writes} writes by {args.writers} processes "
+          f"in {elapsed:.2f}s ({elapsed / writes * 1000:.2f} ms per write)")
+    print(f"profiles lost: {len(lost)}, profiles corrupted: {len(corrupted)}")
+    sys.exit(1 if len(lost) > 0 or len(corrupted) > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
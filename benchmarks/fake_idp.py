@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Local stand-ins for an identity provider and for https://signin.aws.amazon.com/saml, serving pages
+# with the elements browser.py looks for (loginfmt, password, otc, idRichContext_DisplaySign, "Not now"...)
+import base64
+import threading
+from datetime import datetime, timedelta, timezone
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# flows: Sequence of pages served for each kind of identity provider
+flows = {
+    # Microsoft Entra with password then number matching on authenticator app then "Stay signed in?"
+    "microsoft": ["login", "password", "number_matching", "stay_signed_in", "saml"],
+    # Microsoft Entra with password then one time code then "Not now" on connection improvement
+    "microsoft-otc": ["login", "password", "otc", "not_now", "saml"],
+    # Microsoft Entra federated to ADFS: password only, no MFA nor page after it
+    "adfs": ["login", "password", "saml"],
+    # Keycloak realm of docker/keycloak: login and password on the same page, then one time code
+    "keycloak": ["credentials", "keycloak_otp", "saml"],
+}
+
+# number_matching_delay: Milliseconds before the fake authenticator app approves the sign in
+number_matching_delay = 500
+
+
+def make_saml_response(role_arns, principal_arn, validity=timedelta(minutes=5), session_duration=3600):
+    # attributes order follows what moto expects: RoleSessionName, Role, SessionDuration
+    not_on_or_after = (datetime.now(timezone.utc) + validity).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    role_values = "".join(f"<AttributeValue>{role_arn},{principal_arn}</AttributeValue>" for role_arn in role_arns)
+    saml_response = (
+        '<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol">'
+        '<Assertion xmlns="urn:oasis:names:tc:SAML:2.0:assertion">'
+        '<Subject><SubjectConfirmation Method="urn:oasis:names:tc:SAML:2.0:cm:bearer">'
+        f'<SubjectConfirmationData NotOnOrAfter="{not_on_or_after}" Recipient="https://signin.aws.amazon.com/saml"/>'
+        '</SubjectConfirmation></Subject>'
+        f'<Conditions NotOnOrAfter="{not_on_or_after}"/>'
+        '<AttributeStatement>'
+        '<Attribute Name="https://aws.amazon.com/SAML/Attributes/RoleSessionName"><AttributeValue>benchmark</AttributeValue></Attribute>'
+        f'<Attribute Name="https://aws.amazon.com/SAML/Attributes/Role">{role_values}</Attribute>'
+        f'<Attribute Name="https://aws.amazon.com/SAML/Attributes/SessionDuration"><AttributeValue>{session_duration}</AttributeValue></Attribute>'
+        '</AttributeStatement></Assertion></samlp:Response>'
+    )
+    return base64.b64encode(saml_response.encode("utf8")).decode("ascii")
+
+
+def render(step, next_url, saml_homepage, role_arns, principal_arn):
+    if step == "login":
+        return f'<form method="post" action="{next_url}"><input type="email" name="loginfmt"></form>'
+    if step == "password":
+        return (f'<form method="post" action="{next_url}"><input type="password" name="passwd" tabindex="0">'
+                '<input type="submit" value="Sign in"></form>')
+    if step == "credentials":
+        return (f'<form method="post" action="{next_url}"><input type="text" name="username">'
+                '<input type="password" name="password"><input type="hidden" name="credentialId" value="">'
+                '<input type="submit" name="login" value="Sign In"></form>')
+    if step == "keycloak_otp":
+        return (f'<form method="post" action="{next_url}"><input type="text" name="otp" autocomplete="off">'
+                '<input type="submit" name="login" value="Sign In"></form>')
+    if step == "otc":
+        return f'<form method="post" action="{next_url}"><input type="tel" name="otc"></form>'
+    if step == "number_matching":
+        return (f'<div id="idRichContext_DisplaySign">42</div>'
+                f'<script>setTimeout(function() {{ location.href = "{next_url}"; }}, {number_matching_delay});</script>')
+    if step == "stay_signed_in":
+        return f'<form method="post" action="{next_url}"><input type="submit" value="No"></form>'
+    if step == "not_now":
+        return f'<a href="{next_url}">Not now</a>'
+    if step == "saml":
+        return (f'<form method="post" action="{saml_homepage}">'
+                f'<input type="hidden" name="SAMLResponse" value="{escape(make_saml_response(role_arns, principal_arn))}"></form>'
+                '<script>document.forms[0].submit();</script>')
+    raise ValueError(step)
+
+
+class FakeIdentityProvider():
+
+    def __init__(self, role_arns, principal_arn):
+        self.role_arns = role_arns
+        self.principal_arn = principal_arn
+        self.saml_responses = []
+        # identity provider on 127.0.0.1 and AWS stand-in on localhost so that
+        # browser.awsdomain never matches an identity provider page
+        self.idp_server = ThreadingHTTPServer(("127.0.0.1", 0), self.idp_handler())
+        self.aws_server = ThreadingHTTPServer(("127.0.0.1", 0), self.aws_handler())
+        self.saml_homepage = f"http://localhost:{self.aws_server.server_port}/saml"
+
+    def url(self, flow):
+        return f"http://127.0.0.1:{self.idp_server.server_port}/{flow}/0"
+
+    def idp_handler(self):
+        fake_idp = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                _, flow, index = self.path.split("/")
+                steps = flows[flow]
+                next_url = f"/{flow}/{min(int(index) + 1, len(steps) - 1)}"
+                body = render(steps[int(index)], next_url, fake_idp.saml_homepage, fake_idp.role_arns, fake_idp.principal_arn)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.end_headers()
+                self.wfile.write(f"<html><body>{body}</body></html>".encode("utf8"))
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def aws_handler(self):
+        fake_idp = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf8")
+                fake_idp.saml_responses.append(parse_qs(body)["SAMLResponse"][0])
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.end_headers()
+                self.wfile.write(b"<html><body>Amazon Web Services Sign-In</body></html>")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        for server in [self.idp_server, self.aws_server]:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        for server in [self.idp_server, self.aws_server]:
+            server.shutdown()
+            server.server_close()
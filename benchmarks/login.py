@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# End to end headless login benchmark against the local fake identity provider of fake_idp.py:
+#   docker-compose up -d localstack   # or: moto_server sts -p 4566
+#   python benchmarks/login.py --flow microsoft --runs 10 --endpoint-url http://localhost:4566
+# Requires the selected browser (Edge by default) to be installed, drivers are resolved as usual,
+# except with --login-engine http that fills in the forms without browser (keycloak and adfs flows).
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+sys.path.insert(0, Path(__file__).resolve().parent.as_posix())
+
+from fake_idp import FakeIdentityProvider, flows
+
+idp_nickname = "Benchmark"
+role_arn = "arn:aws:iam::000000000000:role/Role.Admin"
+principal_arn = "arn:aws:iam::000000000000:saml-provider/SamlExampleProvider"
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def seed_configuration(idp_url, browser_name):
+    # known identity provider with stored login and an existing browser profile: no prompt nor first time page
+    from awscli_saml_sso.config_parser import CONFIG_FOLDER, CustomConfigParser
+    config_parser = CustomConfigParser()
+    config_parser.store_idp_url(idp_nickname, idp_url)
+    config_parser.store_login(idp_nickname, "benchmark@example.com")
+    user_data_dir = CONFIG_FOLDER / "profile" / browser_name / "benchmark"
+    user_data_dir.mkdir(parents=True, exist_ok=True)
+    config_parser.store_browser_details(idp_nickname, browser_name, user_data_dir.as_posix())
+
+
+def report(name, values):
+    print(f"{name:<8} {statistics.median(values):>9.3f} {percentile(values, 95):>9.3f} "
+          f"{min(values):>9.3f} {max(values):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure headless login latency against a local fake identity provider")
+    parser.add_argument("--flow", choices=sorted(flows), default="microsoft")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--browser", choices=["Edge", "Chrome"], default="Edge")
+    parser.add_argument("--login-engine", choices=["browser", "http"], default="browser")
+    parser.add_argument("--endpoint-url", default=os.environ.get("ASS_ENDPOINT_URL", "http://localhost:4566"),
+                        help="STS endpoint served by localstack or moto")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home, FakeIdentityProvider([role_arn], principal_arn) as fake_idp:
+        # environment is read at import time by awscli_saml_sso modules
+        os.environ["HOME"] = home
+        os.environ["ASS_AWS_SAML_HOMEPAGE"] = fake_idp.saml_homepage
+        # chromium does not send loopback traffic through seleniumwire proxy unless told so
+        os.environ["ASS_BROWSER_ARGUMENTS"] = "--proxy-bypass-list=<-loopback>"
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        Path(home, ".awscli_saml_sso").mkdir()
+
+        from awscli_saml_sso.browser import login_and_get_assertion
+        from awscli_saml_sso.sts import assume_role_with_saml
+
+        seed_configuration(fake_idp.url(args.flow), args.browser)
+        logins, sts_calls = [], []
+        # password comes from stored value, MFA code prompt of the otc flow gets a fixed answer
+        with mock.patch("awscli_saml_sso.config_parser.CustomConfigParser.get_password", return_value="password"), \
+                mock.patch("builtins.input", return_value="123456"):
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                assertion, _ = login_and_get_assertion(idp_nickname=idp_nickname, use_stored=True, use_cache=False,
+                                                       login_engine=args.login_engine)
+                logged_in = time.perf_counter()
+                assume_role_with_saml(idp_nickname, role_arn, principal_arn, assertion, args.endpoint_url)
+                logins.append(logged_in - start)
+                sts_calls.append(time.perf_counter() - logged_in)
+
+        print(f"\nflow={args.flow} engine={args.login_engine} browser={args.browser} runs={args.runs} (seconds)")
+        print(f"{'step':<8} {'p50':>9} {'p95':>9} {'min':>9} {'max':>9}")
+        report("login", logins)
+        report("sts", sts_calls)
+        report("total", [login + sts for login, sts in zip(logins, sts_calls)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Measure cold start time of the awscli_saml_sso command line for paths that must stay fast:
+#   python benchmarks/startup.py [--runs 20]
+# Each run is a new python process with an isolated HOME, the cache-hit run serves
+# credentials previously cached for --credential-process without any login, the exec hit run
+# does the same for exec with a command doing nothing, the status run
+# lists 500 profiles recorded in the profile index.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_folder = Path(__file__).resolve().parent.parent
+
+idp_nickname = "Benchmark"
+role_arn = "arn:aws:iam::000000000000:role/Role.Admin"
+
+scenarios = {
+    "--version": (["--version"], None),
+    "cache hit": (["--credential-process", f"--idp-nickname={idp_nickname}", f"--role-arn={role_arn}"], None),
+    "exec hit": ([f"--idp-nickname={idp_nickname}", f"--role-arn={role_arn}", "exec", "--", "true"], None),
+    "status": (["status"], None),
+    # last as it moves the isolated ~/.awscli_saml_sso folder away
+    "--clean": (["--clean"], "y\n"),
+}
+
+
+def seed_credentials_cache(home):
+    seed = (
+        "from datetime import datetime, timedelta, timezone\n"
+        "from awscli_saml_sso.cache import store_credentials\n"
+        "from awscli_saml_sso.profile_index import profile_entry, record_profiles\n"
+        f"store_credentials({idp_nickname!r}, {role_arn!r}, {{'AccessKeyId': 'ASIA', 'SecretAccessKey': 'secret',"
+        " 'SessionToken': 'token', 'Expiration': datetime.now(timezone.utc) + timedelta(hours=1)})\n"
+        f"record_profiles({{f'{{i:012d}}-Role.Admin': profile_entry({idp_nickname!r}, f'arn:aws:iam::{{i:012d}}:role/Role.Admin',"
+        " {'Expiration': datetime.now(timezone.utc) + timedelta(minutes=i)}) for i in range(500)})\n"
+    )
+    subprocess.run([sys.executable, "-c", seed], env=environment(home), cwd=project_folder, check=True)
+
+
+def environment(home):
+    env = dict(os.environ, HOME=home, PYTHONPATH=project_folder.as_posix())
+    env.pop("ASS_LOG_LEVEL", None)
+    return env
+
+
+def measure(home, command, stdin, runs):
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + command, input=stdin, env=environment(home),
+                       cwd=project_folder, stdout=subprocess.DEVNULL, universal_newlines=True, check=True)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def report(name, durations):
+    print(f"{name:<12} {min(durations):>10.1f} {statistics.median(durations):>12.1f} {max(durations):>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure awscli_saml_sso cold start time")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        Path(home, ".awscli_saml_sso").mkdir()
+        seed_credentials_cache(home)
+
+        print(f"{'scenario':<12} {'min (ms)':>10} {'median (ms)':>12} {'max (ms)':>10}")
+        # bare interpreter start up, the floor of every scenario
+        report("python", measure(home, ["-c", "pass"], None, args.runs))
+        for name, (scenario_args, stdin) in scenarios.items():
+            report(name, measure(home, ["-m", "awscli_saml_sso.main"] + scenario_args, stdin, args.runs))
+
+
+if __name__ == "__main__":
+    main()
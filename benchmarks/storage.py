@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Benchmark of the storage backends of identity provider settings and of the profile index:
+#   python benchmarks/storage.py [--sizes 1000,10000] [--runs 20]
+# Each size fills as many identity providers and profiles, then measures what a run of the command line does:
+# open the settings and read one of them, store one setting, record one issued profile, and the status of one
+# profile or of them all. The ini backend parses and rewrites whole files, the sqlite one only touches rows in use.
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+# config folder is read from home at import time
+os.environ["HOME"] = tempfile.mkdtemp(prefix="awscli_saml_sso_benchmark_")
+
+from awscli_saml_sso import storage
+from awscli_saml_sso.config_parser import CONFIG_FOLDER
+from awscli_saml_sso.profile_index import read_profiles, record_profiles
+
+
+def profile_entry(i):
+    return {
+        "role_arn": f"arn:aws:iam::{i:012d}:role/Role.Admin",
+        "idp_nickname": f"tenant{i}",
+        "expiration": (datetime.now(timezone.utc) + timedelta(minutes=i)).isoformat(),
+    }
+
+
+def fill(size):
+    settings = storage.open_settings()
+    for i in range(size):
+        idp_nickname = f"tenant{i}"
+        settings.set(idp_nickname, "idp_url", f"https://login.example.com/{i}/saml2")
+        settings.set(idp_nickname, "login", f"consultant@tenant{i}.example.com")
+        settings.set(idp_nickname, "browser_name", "Chrome")
+        settings.set(idp_nickname, "user_data_dir", f"/tmp/profile/{i}")
+        settings.set(idp_nickname, "login_engine", "browser")
+    settings.commit()
+    record_profiles({f"{i:012d}-Role.Admin": profile_entry(i) for i in range(size)})
+
+
+def read_setting(size):
+    storage.open_settings().get(f"tenant{size // 2}", "idp_url")
+
+
+def store_setting(size):
+    settings = storage.open_settings()
+    settings.set(f"tenant{size // 2}", "login_engine", "http")
+    settings.commit()
+
+
+def record_profile(size):
+    record_profiles({f"{size // 2:012d}-Role.Admin": profile_entry(size // 2)})
+
+
+def status_one(size):
+    read_profiles([f"{size // 2:012d}-Role.Admin"])
+
+
+def status_all(size):
+    read_profiles()
+
+
+operations = {
+    "read setting": read_setting,
+    "store setting": store_setting,
+    "record profile": record_profile,
+    "status one": status_one,
+    "status all": status_all,
+}
+
+
+def measure(operation, size, runs):
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        operation(size)
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ini and sqlite storage backends")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma separated numbers of identity providers and profiles")
+    parser.add_argument("--runs", type=int, default=20, help="Runs of each operation, the median is reported")
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'size':>6} " + " ".join(f"{name:>15}" for name in operations) + "   (median ms)")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        for backend in ("ini", "sqlite"):
+            shutil.rmtree(CONFIG_FOLDER, ignore_errors=True)
+            CONFIG_FOLDER.mkdir()
+            storage.storage_backend = backend
+            fill(size)
+            medians = [measure(operation, size, args.runs) for operation in operations.values()]
+            print(f"{backend:<8} {size:>6} " + " ".join(f"{median:>15.2f}" for median in medians))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(os.environ["HOME"])